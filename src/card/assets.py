@@ -0,0 +1,153 @@
+import functools
+import hashlib
+import os
+from collections import OrderedDict
+from PIL import Image, ImageDraw, ImageFont
+from card.background import draw_background
+from card.constants import (
+    DEFAULT_COVER,
+    IMAGE_HEIGHT,
+    IMAGE_WIDTH,
+    TORUS_BOLD,
+    TORUS_REGULAR,
+    TORUS_SEMIBOLD,
+)
+from card.helpers import (
+    calculate_corner_radius,
+    convert_country_code_to_unicode,
+    fit_image_to_aspect_ratio,
+)
+
+# Fonts and icons are loaded and resized once per process and shared between
+# renders, draw functions must not modify them
+
+GRADES = ("XH", "X", "SH", "S", "A", "B", "C", "D")
+FONT_SIZES = {
+    TORUS_REGULAR: (42, 60, 64, 96),
+    TORUS_SEMIBOLD: (42, 44, 48, 64, 96),
+    TORUS_BOLD: (96,),
+}
+
+# Covers cropped and resized to the header, by hash of the cover image
+HEADER_COVER_CACHE_SIZE = 32
+header_covers = OrderedDict()
+
+
+@functools.lru_cache(maxsize=None)
+def get_font(path, size):
+    return ImageFont.truetype(path, size)
+
+
+@functools.lru_cache(maxsize=None)
+def get_image(path, mode=None):
+    image = Image.open(path)
+    if mode is not None:
+        return image.convert(mode)
+
+    image.load()
+    return image
+
+
+def get_default_cover():
+    return get_image(DEFAULT_COVER)
+
+
+def get_osu_logo():
+    return get_image("src/resources/images/osu.png")
+
+
+def get_level_hexagon():
+    return get_image("src/resources/images/level-hexagon.png")
+
+
+@functools.lru_cache(maxsize=None)
+def get_user_icon():
+    user_icon = Image.open("src/resources/images/user-solid.png").convert("RGBA")
+    user_icon.thumbnail((80, 80), Image.LANCZOS)
+
+    return user_icon
+
+
+@functools.lru_cache(maxsize=None)
+def get_heart_icon():
+    return (
+        Image.open("src/resources/images/heart-solid.png")
+        .convert("RGBA")
+        .resize((80, 80), Image.LANCZOS)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_grade_icon(grade):
+    grade_image = Image.open(f"src/resources/images/grades/{grade}.png").convert("RGBA")
+    grade_image.thumbnail((IMAGE_HEIGHT // 8, IMAGE_HEIGHT // 8), Image.LANCZOS)
+
+    return grade_image
+
+
+@functools.lru_cache(maxsize=None)
+def get_flag(country_code):
+    unicode_hex = convert_country_code_to_unicode(country_code)
+    flag_path = f"src/resources/twemoji/{unicode_hex}.png"
+    if os.path.exists(flag_path):
+        return get_image(flag_path, "RGBA")
+
+    country_flag = Image.open("src/resources/images/unknown.png").convert("RGBA")
+    country_flag.thumbnail((72, 72), Image.LANCZOS)
+
+    return country_flag
+
+
+@functools.lru_cache(maxsize=None)
+def get_card_template():
+    """Layer shared by every card, renders start from a copy of it"""
+    template = Image.new("RGBA", (IMAGE_WIDTH, IMAGE_HEIGHT), (0, 0, 0, 0))
+    draw_background(ImageDraw.Draw(template))
+
+    return template
+
+
+@functools.lru_cache(maxsize=None)
+def get_rounded_mask(size, percentage):
+    corner_radius = calculate_corner_radius(size[0], size[1], percentage)
+    mask = Image.new("L", size, 0)
+    mask_draw = ImageDraw.Draw(mask)
+    mask_draw.rounded_rectangle([(0, 0), size], corner_radius, fill=255)
+
+    return mask
+
+
+def get_header_cover(cover_data):
+    """The cover, or the default one when None, fitted to the header"""
+    key = hashlib.sha1(cover_data).digest() if cover_data else None
+    if key in header_covers:
+        header_covers.move_to_end(key)
+        return header_covers[key]
+
+    cover = cover_data or get_default_cover()
+    header_image = fit_image_to_aspect_ratio(cover, IMAGE_WIDTH / (IMAGE_HEIGHT // 4))
+    header_image = header_image.resize(
+        (IMAGE_WIDTH, IMAGE_HEIGHT // 4), resample=Image.LANCZOS
+    )
+
+    header_covers[key] = header_image
+    if len(header_covers) > HEADER_COVER_CACHE_SIZE:
+        header_covers.popitem(last=False)
+
+    return header_image
+
+
+def preload_assets():
+    for path, sizes in FONT_SIZES.items():
+        for size in sizes:
+            get_font(path, size)
+
+    get_default_cover()
+    get_osu_logo()
+    get_level_hexagon()
+    get_user_icon()
+    get_heart_icon()
+    for grade in GRADES:
+        get_grade_icon(grade)
+    get_card_template()
+    get_header_cover(None)
@@ -0,0 +1,192 @@
+"""Renders cards from fixture data without Discord or the database and prints the
+time spent in each stage. Run from the repository root:
+
+    PYTHONPATH=src python -m card.benchmark --runs 50 --avatar avatar.png
+
+--user reads the user row from a JSON file instead of the built-in fixture,
+--cold clears the colour, cover and gradient caches before every run.
+"""
+import argparse
+import contextlib
+import datetime
+import functools
+import io
+import json
+import resource
+import time
+from decimal import Decimal
+import card.body as body
+import card.encode as encode
+import card.header as header
+from card.assets import header_covers, preload_assets
+from card.embed import get_card_embed
+from card.fetch import get_placeholder_avatar
+from card.helpers import image_colors
+from card.image import CardRenderer
+
+USER_DATA = {
+    "user_id": 2,
+    "username": "peppy",
+    "avatar_url": "https://a.ppy.sh/2",
+    "cover_url": None,
+    "level": Decimal("101.5"),
+    "country_code": "AU",
+    "groups": json.dumps([{"short_name": "PPY", "colour": "#0066FF"}]),
+    "follower_count": 12345,
+    "is_supporter": True,
+    "support_level": 3,
+    "profile_colour": None,
+    "join_date": datetime.datetime(2007, 8, 28),
+    "score_rank": 42,
+    "global_rank": 1234,
+    "country_rank": 56,
+    "medal_count": 120,
+    "pp": Decimal("8123.456"),
+    "playtime": 1800125,
+    "playcount": 54321,
+    "hit_accuracy": Decimal("98.76"),
+    "ranked_score": 123456789012,
+    "total_score": 987654321098,
+    "scores_count": 12345,
+    "beatmaps_count": 98765,
+    "grade_xh_count": 10,
+    "grade_x_count": 200,
+    "grade_sh_count": 30,
+    "grade_s_count": 4000,
+    "grade_a_count": 5000,
+    "grade_b_count": 600,
+    "grade_c_count": 70,
+    "grade_d_count": 8,
+}
+
+# Columns of users2 the JSON fixture stores as strings
+DECIMAL_COLUMNS = ("level", "pp", "hit_accuracy")
+DATE_COLUMNS = ("join_date",)
+
+# Stage name -> functions timed under it, looked up where the card code calls them
+STAGES = {
+    "colour": [(header, "get_image_color")],
+    "header background": [(header, "draw_header_background")],
+    "avatar": [(header, "draw_avatar")],
+    "pills": [
+        (header, "draw_user_group_pill"),
+        (header, "draw_followers_pill"),
+        (header, "draw_supporter_pill"),
+        (header, "draw_pills"),
+    ],
+    "ranks": [(body, "draw_ranks")],
+    "stats": [(body, "draw_stats")],
+    "grades": [(body, "draw_grades")],
+    "encode": [(encode, "encode_card")],
+}
+
+# stage -> seconds spent in it during the current run
+stage_times = {}
+
+
+def timed(stage, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stage_times[stage] += time.perf_counter() - start_time
+
+    return wrapper
+
+
+def instrument():
+    for stage, functions in STAGES.items():
+        for module, name in functions:
+            setattr(module, name, timed(stage, getattr(module, name)))
+
+
+def load_user_data(path):
+    with open(path) as file:
+        user_data = json.load(file)
+    for column in DECIMAL_COLUMNS:
+        user_data[column] = Decimal(str(user_data[column]))
+    for column in DATE_COLUMNS:
+        user_data[column] = datetime.datetime.fromisoformat(user_data[column])
+
+    return user_data
+
+
+def read_file(path):
+    if path is None:
+        return None
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def clear_caches():
+    image_colors.clear()
+    header_covers.clear()
+    header.get_header_gradient.cache_clear()
+
+
+def render_once(user_data, avatar_data, cover_data, cold):
+    if cold:
+        clear_caches()
+    for stage in list(STAGES) + ["card", "embed", "total"]:
+        stage_times[stage] = 0
+
+    start_time = time.perf_counter()
+    with CardRenderer() as renderer:
+        renderer.render(user_data, avatar_data, cover_data)
+        stage_times["card"] = time.perf_counter() - start_time
+        # encode_card prints every card, not wanted here
+        with contextlib.redirect_stdout(io.StringIO()):
+            image_data, extension = encode.encode_card(renderer.image)
+
+    embed_start_time = time.perf_counter()
+    get_card_embed(image_data, extension, user_data, user_data["avatar_url"])
+    stage_times["embed"] = time.perf_counter() - embed_start_time
+    stage_times["total"] = time.perf_counter() - start_time
+
+    return dict(stage_times), len(image_data)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark !card rendering")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--user", help="JSON file with a users2 row and card counts")
+    parser.add_argument("--avatar", help="image file, a placeholder by default")
+    parser.add_argument("--cover", help="image file, the default cover by default")
+    parser.add_argument("--cold", action="store_true")
+    args = parser.parse_args()
+
+    user_data = load_user_data(args.user) if args.user else USER_DATA
+    avatar_data = read_file(args.avatar) or get_placeholder_avatar()
+    cover_data = read_file(args.cover)
+
+    preload_assets()
+    instrument()
+    # the first run loads lazily imported Pillow plugins, keep it out of the numbers
+    render_once(user_data, avatar_data, cover_data, args.cold)
+
+    runs = []
+    for _ in range(args.runs):
+        runs.append(render_once(user_data, avatar_data, cover_data, args.cold))
+
+    print(f"{args.runs} runs, {runs[-1][1]:,} bytes per card")
+    print(f"{'stage':<20}{'p50 ms':>10}{'p95 ms':>10}")
+    for stage in runs[0][0]:
+        times = [run[0][stage] * 1000 for run in runs]
+        print(
+            f"{stage:<20}{percentile(times, 0.5):>10.1f}{percentile(times, 0.95):>10.1f}"
+        )
+
+    # kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"peak RSS {peak_rss / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 from decimal import ROUND_HALF_UP
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 
+from card.assets import get_font, get_grade_icon
 from card.constants import IMAGE_HEIGHT, IMAGE_WIDTH, TORUS_SEMIBOLD, TORUS_REGULAR
 from card.helpers import get_rank_tier
 
@@ -19,8 +20,8 @@ def draw_fancy_rank(header_text, rank):
     colors = tier["colors"]
     rank_text = f"#{rank:,}" if rank and rank > 0 else "-"
 
-    font_header = ImageFont.truetype(TORUS_SEMIBOLD, header_font_size)
-    font_rank = ImageFont.truetype(tier["font_path"], rank_font_size)
+    font_header = get_font(TORUS_SEMIBOLD, header_font_size)
+    font_rank = get_font(tier["font_path"], rank_font_size)
 
     _, _, header_width, _ = font_header.getbbox(header_text)
     _, _, value_width, value_height = font_rank.getbbox(rank_text)
@@ -41,18 +42,15 @@ def draw_fancy_rank(header_text, rank):
     start_color = colors[0]
     end_color = colors[1]
 
-    gradient = np.linspace(0, 1, value_height)
+    gradient = np.linspace(0, 1, value_height)[:, np.newaxis]
+    start = np.array(start_color[:3], dtype=np.float64)
+    end = np.array(end_color[:3], dtype=np.float64)
+    row_colors = (start + (end - start) * gradient).astype(np.uint8)
 
-    gradient_image = Image.new("RGBA", (value_width, value_height))
-    gradient_draw = ImageDraw.Draw(gradient_image)
-
-    for j in range(value_height):
-        r = int(start_color[0] + (end_color[0] - start_color[0]) * gradient[j])
-        g = int(start_color[1] + (end_color[1] - start_color[1]) * gradient[j])
-        b = int(start_color[2] + (end_color[2] - start_color[2]) * gradient[j])
-        gradient_color = (r, g, b)
-
-        gradient_draw.line([(0, j), (value_width, j)], fill=gradient_color, width=1)
+    gradient_array = np.empty((value_height, value_width, 4), dtype=np.uint8)
+    gradient_array[:, :, :3] = row_colors[:, np.newaxis, :]
+    gradient_array[:, :, 3] = 255
+    gradient_image = Image.fromarray(gradient_array, "RGBA")
 
     alpha_image = Image.new("L", (value_width, value_height))
     alpha_draw = ImageDraw.Draw(alpha_image)
@@ -70,8 +68,8 @@ def draw_generic_rank(text, rank):
 
     rank_text = f"#{rank:,}" if rank and rank > 0 else "-"
 
-    font_header = ImageFont.truetype(TORUS_SEMIBOLD, header_font_size)
-    font_rank = ImageFont.truetype(TORUS_REGULAR, rank_font_size)
+    font_header = get_font(TORUS_SEMIBOLD, header_font_size)
+    font_rank = get_font(TORUS_REGULAR, rank_font_size)
 
     _, _, header_width, _ = font_header.getbbox(text)
     _, _, value_width, _ = font_rank.getbbox(rank_text)
@@ -108,8 +106,8 @@ def draw_ranks(image, user_data):
 
 def draw_stat(header, value):
     height = 128
-    header_font = ImageFont.truetype(TORUS_SEMIBOLD, 44)
-    stat_font = ImageFont.truetype(TORUS_REGULAR, 60)
+    header_font = get_font(TORUS_SEMIBOLD, 44)
+    stat_font = get_font(TORUS_REGULAR, 60)
 
     if header in ("Accuracy", "Completion"):
         stat_text = f"{value}%"
@@ -152,7 +150,7 @@ def draw_stat(header, value):
     x = 0
     y = 112
     for i, number in enumerate(numbers):
-        font = ImageFont.truetype(TORUS_REGULAR, score_font_size)
+        font = get_font(TORUS_REGULAR, score_font_size)
         _, _, number_width, _ = font.getbbox(number)
 
         stat_draw.text((x, y), number, font=font, fill="#DBF0E9", anchor="ls")
@@ -209,9 +207,8 @@ def draw_stats(image, user_data):
 
 
 def draw_grade(grade, count):
-    grade_image = Image.open(f"src/resources/images/grades/{grade}.png").convert("RGBA")
-    grade_image.thumbnail((IMAGE_HEIGHT // 8, IMAGE_HEIGHT // 8), Image.LANCZOS)
-    font = ImageFont.truetype(TORUS_SEMIBOLD, 48)
+    grade_image = get_grade_icon(grade)
+    font = get_font(TORUS_SEMIBOLD, 48)
     padding = 10
     count_text = f"{count:,}"
     _, _, count_width, count_height = font.getbbox(count_text)
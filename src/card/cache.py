@@ -0,0 +1,115 @@
+import asyncio
+import datetime
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from card.encode import get_encoding_settings
+
+# Encoded cards by fingerprint of everything drawn on them. Cards pushed out of
+# memory are kept on disk when CARD_CACHE_DISK is set in .env.
+CARD_CACHE_SIZE = 32
+CARD_CACHE_DIR = "cache/cards"
+CARD_DISK_CACHE_SIZE = 500
+
+# A user's row is reused for this many seconds, so a card posted again right
+# away skips the query too. The tracker doesn't update users more often.
+CARD_DATA_TTL = 60
+
+# fingerprint -> (image_data, extension)
+card_cache = OrderedDict()
+# (user_id, loved) -> (fetched_at, user_data)
+user_data_cache = {}
+
+
+def get_recent_user_data(user_id, loved):
+    entry = user_data_cache.get((user_id, loved))
+    if entry is None or time.time() - entry[0] > CARD_DATA_TTL:
+        return None
+
+    return entry[1]
+
+
+def remember_user_data(user_id, loved, user_data):
+    now = time.time()
+    for key, (fetched_at, _) in list(user_data_cache.items()):
+        if now - fetched_at > CARD_DATA_TTL:
+            del user_data_cache[key]
+    user_data_cache[(user_id, loved)] = (now, user_data)
+
+
+def get_card_fingerprint(user_data, avatar_data, cover_data, loved):
+    fingerprint = hashlib.sha1()
+    for column, value in sorted(dict(user_data).items()):
+        fingerprint.update(f"{column}={value!r};".encode())
+    for image_data in (avatar_data, cover_data):
+        fingerprint.update(hashlib.sha1(image_data or b"").digest())
+    # the same card encoded differently is a different file, and the join date
+    # is drawn as days ago so the card changes every day
+    fingerprint.update(
+        repr((loved, get_encoding_settings(), datetime.date.today())).encode()
+    )
+
+    return fingerprint.hexdigest()
+
+
+def is_disk_cache_enabled():
+    return os.getenv("CARD_CACHE_DISK", "false").lower() == "true"
+
+
+def get_disk_path(fingerprint, extension):
+    return os.path.join(CARD_CACHE_DIR, f"{fingerprint}.{extension}")
+
+
+def read_spilled_card(fingerprint):
+    for extension in ("png", "webp"):
+        try:
+            with open(get_disk_path(fingerprint, extension), "rb") as file:
+                return file.read(), extension
+        except OSError:
+            pass
+
+    return None
+
+
+def spill_card(fingerprint, card):
+    image_data, extension = card
+    os.makedirs(CARD_CACHE_DIR, exist_ok=True)
+    path = get_disk_path(fingerprint, extension)
+    with open(path + ".tmp", "wb") as file:
+        file.write(image_data)
+    os.replace(path + ".tmp", path)
+
+    paths = [os.path.join(CARD_CACHE_DIR, name) for name in os.listdir(CARD_CACHE_DIR)]
+    if len(paths) > CARD_DISK_CACHE_SIZE:
+        paths.sort(key=os.path.getmtime)
+        for old_path in paths[: len(paths) - CARD_DISK_CACHE_SIZE]:
+            os.remove(old_path)
+
+
+async def get_cached_card(fingerprint):
+    card = card_cache.get(fingerprint)
+    if card is not None:
+        card_cache.move_to_end(fingerprint)
+        return card
+
+    if is_disk_cache_enabled():
+        card = await asyncio.to_thread(read_spilled_card, fingerprint)
+        if card is not None:
+            await store_card(fingerprint, card)
+
+    return card
+
+
+async def store_card(fingerprint, card):
+    card_cache[fingerprint] = card
+    card_cache.move_to_end(fingerprint)
+    if len(card_cache) <= CARD_CACHE_SIZE:
+        return
+
+    old_fingerprint, old_card = card_cache.popitem(last=False)
+    if is_disk_cache_enabled():
+        try:
+            await asyncio.to_thread(spill_card, old_fingerprint, old_card)
+        except OSError as e:
+            print(f"Couldn't write card cache: {e}")
@@ -1,30 +1,106 @@
-import requests
+import asyncio
+import io
 import time
-from card.image import draw_card
+import discord
+from card.cache import (
+    get_cached_card,
+    get_card_fingerprint,
+    get_recent_user_data,
+    remember_user_data,
+    store_card,
+)
+from card.image import render_card, tile_cards
 from card.embed import get_card_embed
+from card.fetch import fetch_card_images, get_avatar_base_url
+from card.worker import run_in_worker
 from sql.db import Database
+from sql.queries import get_user_ids
+from utils.helpers import get_filter_users
 
 db = Database()
 
+# The ranked score ranks and beatmap totals only change when the tracker runs,
+# they are read once per CARD_TOTALS_TTL seconds instead of on every card
+CARD_TOTALS_TTL = 300
+
+card_totals = None
+card_totals_lock = asyncio.Lock()
+
+COUNT_COLUMNS = [
+    "scores_count",
+    "grade_x_count",
+    "grade_xh_count",
+    "grade_s_count",
+    "grade_sh_count",
+    "grade_a_count",
+    "grade_b_count",
+    "grade_c_count",
+    "grade_d_count",
+]
+
+# Discord takes up to 10 files per message
+GALLERY_SIZE = 10
+# users2 columns the gallery can pick its top players by
+GALLERY_ORDERS = ("pp", "ranked_score", "total_score", "playcount", "playtime")
+
 
 def get_avatar_url_from_id(user_id):
-    return f"https://a.ppy.sh/{user_id}?{int(time.time())}"
+    # no cache buster, the image cache revalidates the avatar instead
+    return f"{get_avatar_base_url()}/{user_id}"
 
 
-def get_image_data_from_url(image_url):
-    response = requests.get(image_url)
-    image_data = response.content
-    return image_data
+async def refresh_card_totals():
+    global card_totals
+    rows = await db.execute_query(
+        """SELECT
+            COUNT(DISTINCT beatmap_id) FILTER (WHERE approved IN (1, 2)) AS ranked_count,
+            COUNT(DISTINCT beatmap_id) AS loved_count
+        FROM beatmaps
+        WHERE mode = 0 AND approved IN (1, 2, 4)"""
+    )
+    rank_rows = await db.execute_query(
+        "SELECT user_id, RANK() OVER (ORDER BY ranked_score DESC) AS score_rank FROM users2"
+    )
+    card_totals = {
+        "fetched_at": time.time(),
+        "beatmaps_count": {
+            False: rows[0]["ranked_count"],
+            True: rows[0]["loved_count"],
+        },
+        "score_ranks": {row["user_id"]: row["score_rank"] for row in rank_rows},
+    }
 
 
-async def get_user_data(user_id, kwargs):
+async def get_card_totals(user_ids):
+    """Global values of the card, refreshed every CARD_TOTALS_TTL seconds or when a
+    user registered since the last refresh"""
+    async with card_totals_lock:
+        if (
+            card_totals is None
+            or time.time() - card_totals["fetched_at"] > CARD_TOTALS_TTL
+            or any(user_id not in card_totals["score_ranks"] for user_id in user_ids)
+        ):
+            await refresh_card_totals()
+
+    return card_totals
+
+
+async def get_users_data(user_ids, kwargs):
+    """Card rows of several users in one query, in the order of user_ids. Users
+    missing from the database are left out."""
+    user_ids = [int(user_id) for user_id in user_ids]
+    if len(user_ids) == 0:
+        return []
+    loved = "-loved" in kwargs and kwargs["-loved"] == "true"
+    totals = await get_card_totals(user_ids)
+    counts = ", ".join(
+        f"COALESCE(scores_count_cte.{column}, 0) AS {column}"
+        for column in COUNT_COLUMNS
+    )
     rows = await db.execute_query(
-        f"""WITH beatmaps_count_cte AS (
-            SELECT COUNT(DISTINCT beatmap_id) AS beatmaps_count
-            FROM beatmaps
-            WHERE mode = 0 AND approved IN (1, 2{', 4' if "-loved" in kwargs and kwargs["-loved"] == 'true' else ''})
-        ), scores_count_cte AS (
+        f"""WITH scores_count_cte AS (
             SELECT
+                scores.user_id,
                 COUNT(DISTINCT beatmaps.beatmap_id) AS scores_count,
                 COUNT(CASE WHEN scores.rank = 'X' THEN 1 END) AS grade_x_count,
                 COUNT(CASE WHEN scores.rank = 'XH' THEN 1 END) AS grade_xh_count,
@@ -36,49 +112,69 @@ async def get_user_data(user_id, kwargs):
                 COUNT(CASE WHEN scores.rank = 'D' THEN 1 END) AS grade_d_count
             FROM scores
             LEFT JOIN beatmaps ON beatmaps.beatmap_id = scores.beatmap_id
-            WHERE scores.user_id = {user_id} AND beatmaps.mode = 0
-            AND beatmaps.approved IN (1, 2{', 4' if "-loved" in kwargs and kwargs["-loved"] == 'true' else ''})
-        ), ranked_score_rank_cte AS (
-            SELECT
-                user_id,
-                ranked_score,
-                RANK() OVER (ORDER BY ranked_score DESC) AS score_rank
-            FROM users2
+            WHERE scores.user_id = ANY($1::int[]) AND beatmaps.mode = 0
+            AND beatmaps.approved IN (1, 2{', 4' if loved else ''})
+            GROUP BY scores.user_id
         ), medal_count_cte AS (
             SELECT
+                user_id,
                 COUNT(*) AS medal_count
             FROM user_achievements
-            WHERE user_id = {user_id}
+            WHERE user_id = ANY($1::int[])
+            GROUP BY user_id
         )
         SELECT
             users2.*,
-            beatmaps_count_cte.*,
-            scores_count_cte.*,
-            medal_count_cte.medal_count,
-            ranked_score_rank_cte.score_rank
+            {counts},
+            COALESCE(medal_count_cte.medal_count, 0) AS medal_count
         FROM users2
-        CROSS JOIN beatmaps_count_cte
-        CROSS JOIN scores_count_cte
-        CROSS JOIN medal_count_cte
-        JOIN ranked_score_rank_cte ON ranked_score_rank_cte.user_id = users2.user_id
-        WHERE users2.user_id = {user_id}"""
+        LEFT JOIN scores_count_cte ON scores_count_cte.user_id = users2.user_id
+        LEFT JOIN medal_count_cte ON medal_count_cte.user_id = users2.user_id
+        WHERE users2.user_id = ANY($1::int[])""",
+        user_ids,
     )
-    if len(rows) < 1:
-        raise ValueError(f"Couldn't find user with user_id: {user_id}")
 
-    return rows[0]
+    users_data = {}
+    for row in rows:
+        user_data = dict(row)
+        user_data["beatmaps_count"] = totals["beatmaps_count"][loved]
+        user_data["score_rank"] = totals["score_ranks"].get(user_data["user_id"])
+        users_data[user_data["user_id"]] = user_data
 
+    return [users_data[user_id] for user_id in user_ids if user_id in users_data]
 
-async def get_card(user_id, kwargs):
-    query_start_time = time.time()
 
-    user_data = await get_user_data(user_id, kwargs)
+async def get_user_data(user_id, kwargs):
+    users_data = await get_users_data([user_id], kwargs)
+    if len(users_data) < 1:
+        raise ValueError(f"Couldn't find user with user_id: {user_id}")
+
+    return users_data[0]
+
+
+async def get_card_image(user_data, loved):
+    """The encoded card of the user, its file extension and avatar url"""
+    user_id = user_data["user_id"]
     # Fallback to generating an avatar_url if for some reason the url is not set
     avatar_url = user_data["avatar_url"] or get_avatar_url_from_id(user_id)
-    avatar_data = get_image_data_from_url(avatar_url)
-    image = draw_card(user_data, avatar_data)
-    embed, file = get_card_embed(image, user_data, avatar_url)
+    avatar_data, cover_data = await fetch_card_images(
+        user_id, avatar_url, user_data["cover_url"]
+    )
+
+    fingerprint = get_card_fingerprint(user_data, avatar_data, cover_data, loved)
+    card = await get_cached_card(fingerprint)
+    if card is None:
+        # Rendering takes about a second of CPU, keep it off the event loop
+        card = await run_in_worker(
+            render_card, dict(user_data), avatar_data, cover_data
+        )
+        await store_card(fingerprint, card)
+    image_data, extension = card
+
+    return image_data, extension, avatar_url
 
+
+def set_card_footer(embed, query_start_time):
     query_end_time = time.time()
     query_execution_time = round(query_end_time - query_start_time, 2)
 
@@ -87,4 +183,84 @@ async def get_card(user_id, kwargs):
         icon_url="https://pek.li/maj7qa.png",
     )
 
+
+async def get_card(user_id, kwargs):
+    query_start_time = time.time()
+
+    user_id = int(user_id)
+    loved = kwargs.get("-loved") == "true"
+    user_data = get_recent_user_data(user_id, loved)
+    if user_data is None:
+        user_data = await get_user_data(user_id, kwargs)
+        remember_user_data(user_id, loved, user_data)
+
+    image_data, extension, avatar_url = await get_card_image(user_data, loved)
+    embed, file = get_card_embed(image_data, extension, user_data, avatar_url)
+    set_card_footer(embed, query_start_time)
+
     return embed, file
+
+
+async def get_gallery_user_ids(kwargs):
+    """Users listed with -users, or the top players of users2 by -o"""
+    if kwargs.get("-users"):
+        user_ids = await get_user_ids(get_filter_users(kwargs["-users"]))
+        if len(user_ids) == 0:
+            raise ValueError("None of these users are in the database.")
+        return user_ids[:GALLERY_SIZE]
+
+    order = kwargs.get("-o", "pp")
+    if order not in GALLERY_ORDERS:
+        raise ValueError(f"-o must be one of {', '.join(GALLERY_ORDERS)}")
+    try:
+        limit = int(kwargs.get("-l", GALLERY_SIZE))
+    except ValueError:
+        raise ValueError(f"-l must be a number from 1 to {GALLERY_SIZE}")
+    limit = max(1, min(limit, GALLERY_SIZE))
+    rows = await db.execute_query(
+        f"SELECT user_id FROM users2 WHERE {order} IS NOT NULL ORDER BY {order} DESC LIMIT $1",
+        limit,
+    )
+
+    return [row["user_id"] for row in rows]
+
+
+async def get_gallery(kwargs):
+    """Cards of up to GALLERY_SIZE users, as separate files or tiled into one with
+    -tile true"""
+    query_start_time = time.time()
+
+    loved = kwargs.get("-loved") == "true"
+    user_ids = await get_gallery_user_ids(kwargs)
+    users_data = await get_users_data(user_ids, kwargs)
+    if len(users_data) == 0:
+        raise ValueError("No users found.")
+    for user_data in users_data:
+        remember_user_data(user_data["user_id"], loved, user_data)
+
+    # every card goes to its own worker, CARD_WORKERS render at the same time
+    cards = await asyncio.gather(
+        *(get_card_image(user_data, loved) for user_data in users_data)
+    )
+
+    embed = discord.Embed(
+        title="Card Gallery",
+        description=", ".join(user_data["username"] for user_data in users_data),
+        colour=discord.Colour(0xCC5288),
+    )
+    if kwargs.get("-tile") == "true":
+        image_data, extension = await run_in_worker(
+            tile_cards, [(image_data, extension) for image_data, extension, _ in cards]
+        )
+        filename = f"gallery.{extension}"
+        files = [discord.File(io.BytesIO(image_data), filename=filename)]
+        embed.set_image(url=f"attachment://{filename}")
+    else:
+        files = []
+        for i, (user_data, card) in enumerate(zip(users_data, cards)):
+            image_data, extension, _ = card
+            filename = f"{i + 1}-{user_data['user_id']}.{extension}"
+            files.append(discord.File(io.BytesIO(image_data), filename=filename))
+    set_card_footer(embed, query_start_time)
+
+    return embed, files
@@ -0,0 +1,72 @@
+import io
+import os
+import time
+from PIL import Image
+
+# Card encoding, set in .env:
+# CARD_FORMAT: png, png8 (quantized to 256 colours) or webp (lossless)
+# CARD_COMPRESSION: zlib level of png from 0 to 9, effort of webp from 0 to 6
+# CARD_MAX_BYTES: cards larger than this are encoded again with lossier
+# settings until they fit, 0 to keep the first encoding
+CARD_FORMAT = "png"
+CARD_COMPRESSION = 3
+CARD_MAX_BYTES = 0
+
+# Tried in order when a card is over CARD_MAX_BYTES
+FALLBACK_ENCODINGS = [("png8", None), ("webp", 90), ("webp", 75), ("webp", 60)]
+
+EXTENSIONS = {"png": "png", "png8": "png", "webp": "webp"}
+
+
+def get_encoding_settings():
+    card_format = os.getenv("CARD_FORMAT", CARD_FORMAT).lower()
+    if card_format not in EXTENSIONS:
+        raise ValueError(f"Unknown CARD_FORMAT: {card_format}")
+
+    compression = int(os.getenv("CARD_COMPRESSION", CARD_COMPRESSION))
+    max_bytes = int(os.getenv("CARD_MAX_BYTES", CARD_MAX_BYTES))
+
+    return card_format, compression, max_bytes
+
+
+def encode_image(image, card_format, compression, quality=None):
+    """Encodes with the given format, lossy webp when a quality is given"""
+    image_data = io.BytesIO()
+    if card_format == "png":
+        image.save(image_data, format="PNG", compress_level=min(compression, 9))
+    elif card_format == "png8":
+        image = image.quantize(256, method=Image.FASTOCTREE)
+        image.save(image_data, format="PNG", compress_level=min(compression, 9))
+    elif quality is None:
+        image.save(image_data, format="WEBP", lossless=True, method=min(compression, 6))
+    else:
+        image.save(
+            image_data, format="WEBP", quality=quality, method=min(compression, 6)
+        )
+
+    return image_data.getvalue()
+
+
+def encode_card(image):
+    """Returns the card as bytes and the file extension to upload it with"""
+    card_format, compression, max_bytes = get_encoding_settings()
+
+    start_time = time.perf_counter()
+    image_data = encode_image(image, card_format, compression)
+    encoding = card_format
+
+    if max_bytes > 0:
+        for fallback_format, quality in FALLBACK_ENCODINGS:
+            if len(image_data) <= max_bytes:
+                break
+            image_data = encode_image(image, fallback_format, compression, quality)
+            encoding = fallback_format
+            if quality is not None:
+                encoding = f"{fallback_format}@{quality}"
+        if len(image_data) > max_bytes:
+            print(f"Card is over CARD_MAX_BYTES ({max_bytes}) after every fallback")
+
+    encode_time = round(time.perf_counter() - start_time, 3)
+    print(f"Card encoded as {encoding} in {encode_time}s, {len(image_data):,} bytes")
+
+    return image_data, EXTENSIONS[encoding.split("@")[0]]
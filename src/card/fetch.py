@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import time
+from collections import OrderedDict
+import aiohttp
+from PIL import Image
+
+# Host of the fallback avatar urls, AVATAR_BASE_URL in .env to use a local
+# stand-in
+AVATAR_BASE_URL = "https://a.ppy.sh"
+
+# A slow image host must not hold a card for long, the card falls back to defaults
+FETCH_TIMEOUT = aiohttp.ClientTimeout(total=5, sock_connect=2)
+
+# Images are kept on disk per user and served without any request for
+# IMAGE_CACHE_TTL seconds, then revalidated with their ETag / Last-Modified
+IMAGE_CACHE_DIR = "cache/images"
+IMAGE_CACHE_TTL = 3600
+MEMORY_CACHE_SIZE = 64
+
+# Shared so avatar and cover requests reuse their connections
+session = None
+placeholder_avatar = None
+
+# key -> {"url", "etag", "last_modified", "fetched_at", "data"}
+memory_cache = OrderedDict()
+
+
+def get_avatar_base_url():
+    return os.getenv("AVATAR_BASE_URL", AVATAR_BASE_URL)
+
+
+def get_session():
+    global session
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(timeout=FETCH_TIMEOUT)
+
+    return session
+
+
+async def close_session():
+    global session
+    if session is not None and not session.closed:
+        await session.close()
+    session = None
+
+
+def get_cache_path(key):
+    name = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(IMAGE_CACHE_DIR, name)
+
+
+def read_cache_entry(key):
+    path = get_cache_path(key)
+    try:
+        with open(path + ".json") as file:
+            entry = json.load(file)
+        with open(path + ".bin", "rb") as file:
+            entry["data"] = file.read()
+    except (OSError, ValueError):
+        return None
+
+    return entry
+
+
+def write_cache_entry(key, entry, data_changed):
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    path = get_cache_path(key)
+    # write to temporary files first so a crash never leaves half an image behind
+    if data_changed:
+        with open(path + ".bin.tmp", "wb") as file:
+            file.write(entry["data"])
+        os.replace(path + ".bin.tmp", path + ".bin")
+    with open(path + ".json.tmp", "w") as file:
+        json.dump({k: v for k, v in entry.items() if k != "data"}, file)
+    os.replace(path + ".json.tmp", path + ".json")
+
+
+def remember_cache_entry(key, entry):
+    memory_cache[key] = entry
+    memory_cache.move_to_end(key)
+    if len(memory_cache) > MEMORY_CACHE_SIZE:
+        memory_cache.popitem(last=False)
+
+
+async def get_cache_entry(key, url):
+    entry = memory_cache.get(key)
+    if entry is None:
+        entry = await asyncio.to_thread(read_cache_entry, key)
+        if entry is None:
+            return None
+        remember_cache_entry(key, entry)
+
+    # the user changed their avatar or cover, the old image is useless
+    if entry["url"] != url:
+        return None
+
+    memory_cache.move_to_end(key)
+    return entry
+
+
+async def store_cache_entry(key, entry, data_changed=True):
+    remember_cache_entry(key, entry)
+    try:
+        await asyncio.to_thread(write_cache_entry, key, entry, data_changed)
+    except OSError as e:
+        print(f"Couldn't write image cache: {e}")
+
+
+async def fetch_image(url, key=None):
+    """Image bytes at url, None when the request fails or isn't an image. With a
+    key the image is cached, and a stale copy is used if the host is down."""
+    if not url:
+        return None
+
+    entry = None
+    headers = {}
+    if key is not None:
+        entry = await get_cache_entry(key, url)
+    if entry is not None:
+        if time.time() - entry["fetched_at"] < IMAGE_CACHE_TTL:
+            return entry["data"]
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    cached_data = entry["data"] if entry is not None else None
+
+    try:
+        async with get_session().get(url, headers=headers) as response:
+            if response.status == 304 and entry is not None:
+                entry["fetched_at"] = time.time()
+                await store_cache_entry(key, entry, data_changed=False)
+                return entry["data"]
+
+            content_type = response.content_type
+            if response.status != 200 or not content_type.startswith("image/"):
+                print(f"Couldn't fetch {url}: {response.status} {content_type}")
+                return cached_data
+
+            data = await response.read()
+            if key is not None:
+                entry = {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "fetched_at": time.time(),
+                    "data": data,
+                }
+                await store_cache_entry(key, entry)
+
+            return data
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Couldn't fetch {url}: {e!r}")
+        return cached_data
+
+
+def get_placeholder_avatar():
+    global placeholder_avatar
+    if placeholder_avatar is None:
+        avatar = Image.new("RGB", (256, 256), "#46514D")
+        icon = Image.open("src/resources/images/user-solid.png").convert("RGBA")
+        icon.thumbnail((128, 128), Image.LANCZOS)
+        avatar.paste(
+            icon, ((256 - icon.width) // 2, (256 - icon.height) // 2), icon
+        )
+
+        image_data = io.BytesIO()
+        avatar.save(image_data, format="PNG")
+        placeholder_avatar = image_data.getvalue()
+
+    return placeholder_avatar
+
+
+async def fetch_card_images(user_id, avatar_url, cover_url):
+    """Fetches the avatar and cover together. A missing avatar is replaced by a
+    placeholder, a missing cover is None and drawn as DEFAULT_COVER."""
+    avatar_data, cover_data = await asyncio.gather(
+        fetch_image(avatar_url, f"avatar-{user_id}"),
+        fetch_image(cover_url, f"cover-{user_id}"),
+    )
+    if avatar_data is None:
+        avatar_data = get_placeholder_avatar()
+
+    return avatar_data, cover_data
@@ -1,28 +1,32 @@
 import io
 import datetime
+import functools
 import json
-import os
-import requests
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+from card.assets import (
+    get_flag,
+    get_font,
+    get_header_cover,
+    get_heart_icon,
+    get_level_hexagon,
+    get_osu_logo,
+    get_rounded_mask,
+    get_user_icon,
+)
 from card.constants import (
-    DEFAULT_COVER,
     IMAGE_HEIGHT,
     IMAGE_WIDTH,
     TORUS_BOLD,
     TORUS_REGULAR,
     TORUS_SEMIBOLD,
 )
-from card.helpers import (
-    get_image_color,
-    fit_image_to_aspect_ratio,
-    calculate_corner_radius,
-    convert_country_code_to_unicode,
-)
+from card.helpers import get_image_color
 
 
-def draw_header(image, draw, user_data, avatar_data):
+def draw_header(image, draw, user_data, avatar_data, cover_data=None):
     avatar_color = get_image_color(avatar_data)
-    draw_header_background(image, avatar_color, user_data["cover_url"])
+    draw_header_background(image, avatar_color, cover_data)
     draw_avatar(image, avatar_data)
     draw_user_group_line(draw, user_data)
     draw_level(image, draw, user_data["level"])
@@ -41,44 +45,32 @@ def draw_header(image, draw, user_data, avatar_data):
     draw_join_date(draw, user_data["join_date"])
 
 
-def draw_header_background(image, avatar_color, cover_url):
-    if cover_url:
-        res = requests.get(cover_url)
-        if res.status_code == requests.codes.ok:
-            cover = res.content
-        else:
-            cover = DEFAULT_COVER
-    else:
-        cover = DEFAULT_COVER
+@functools.lru_cache(maxsize=64)
+def get_header_gradient(size, avatar_color):
+    """Avatar colour fading from opaque to 60% left to right"""
+    width, height = size
+    start_opacity = 255
+    end_opacity = 153  # 60%
 
-    header_image = fit_image_to_aspect_ratio(cover, IMAGE_WIDTH / (IMAGE_HEIGHT // 4))
+    t = np.arange(width) / (width - 1)
+    opacity = ((1 - t) * start_opacity + t * end_opacity).astype(np.uint8)
 
-    header_image = header_image.resize(
-        (IMAGE_WIDTH, IMAGE_HEIGHT // 4), resample=Image.LANCZOS
-    )
+    gradient = np.empty((height, width, 4), dtype=np.uint8)
+    gradient[:, :, :3] = avatar_color
+    gradient[:, :, 3] = opacity
 
-    header_image_x = 0
-    header_image_y = 0
+    return Image.fromarray(gradient, "RGBA")
 
-    corner_radius = calculate_corner_radius(header_image.width, header_image.height, 20)
-    mask = Image.new("L", header_image.size, 0)
-    mask_draw = ImageDraw.Draw(mask)
-    mask_draw.rounded_rectangle([(0, 0), header_image.size], corner_radius, fill=255)
 
-    gradient_image = Image.new("RGBA", header_image.size)
-    gradient_draw = ImageDraw.Draw(gradient_image)
+def draw_header_background(image, avatar_color, cover_data):
+    header_image = get_header_cover(cover_data)
 
-    start_opacity = 255
-    end_opacity = 153  # 60%
-
-    for x in range(header_image.width):
-        t = x / (header_image.width - 1)
-
-        opacity = int((1 - t) * start_opacity + t * end_opacity)
+    header_image_x = 0
+    header_image_y = 0
 
-        color = avatar_color + (opacity,)
-        gradient_draw.line([(x, 0), (x, header_image.height - 1)], fill=color)
+    mask = get_rounded_mask(header_image.size, 20)
 
+    gradient_image = get_header_gradient(header_image.size, avatar_color)
     header_image = Image.alpha_composite(header_image, gradient_image)
 
     image.paste(header_image, (header_image_x, header_image_y), mask)
@@ -94,10 +86,7 @@ def draw_avatar(image, avatar_data):
     avatar_x = 0
     avatar_y = 0
 
-    corner_radius = calculate_corner_radius(avatar_size[0], avatar_size[1], 15)
-    mask = Image.new("L", avatar_size, 0)
-    mask_draw = ImageDraw.Draw(mask)
-    mask_draw.rounded_rectangle([(0, 0), avatar_size], corner_radius, fill=255)
+    mask = get_rounded_mask(avatar_size, 15)
 
     avatar_with_rounded_corners = Image.new("RGBA", avatar_size, (0, 0, 0, 0))
     avatar_with_rounded_corners.paste(avatar_image, mask=mask)
@@ -145,7 +134,7 @@ def draw_user_group_line(draw, user_data):
 
 def draw_username(image, draw, username):
     font_size = 64
-    font = ImageFont.truetype(TORUS_SEMIBOLD, font_size)
+    font = get_font(TORUS_SEMIBOLD, font_size)
     text_color = "white"
     shadow_color = (0, 0, 0, 64)
 
@@ -167,7 +156,7 @@ def draw_osu_logo(image):
     osu_logo_x = int(IMAGE_WIDTH // 4.8)
     osu_logo_y = int(IMAGE_HEIGHT // 8.5)
 
-    osu_logo = Image.open("src/resources/images/osu.png")
+    osu_logo = get_osu_logo()
 
     image.paste(osu_logo, (osu_logo_x, osu_logo_y), osu_logo)
 
@@ -182,7 +171,7 @@ def draw_user_group_pill(groups_string):
     pill_height = 128
 
     font_size = 96
-    font = ImageFont.truetype(TORUS_BOLD, font_size)
+    font = get_font(TORUS_BOLD, font_size)
     text_width, _ = font.getsize(group_name)
 
     pill_width = text_width + padding * 2
@@ -205,15 +194,14 @@ def draw_user_group_pill(groups_string):
 
 def draw_followers_pill(follower_count):
     follower_count_string = f"{follower_count:,}"
-    user_icon = Image.open("src/resources/images/user-solid.png").convert("RGBA")
-    user_icon.thumbnail((80, 80), Image.LANCZOS)
+    user_icon = get_user_icon()
 
     padding = 40
     pill_height = 128
     text_padding = 20
 
     font_size = 96
-    font = ImageFont.truetype(TORUS_SEMIBOLD, font_size)
+    font = get_font(TORUS_SEMIBOLD, font_size)
     text_width, text_height = font.getsize(follower_count_string)
 
     pill_width = text_padding * 2 + user_icon.width + text_width + padding * 2
@@ -239,11 +227,7 @@ def draw_followers_pill(follower_count):
 
 
 def draw_supporter_pill(support_level):
-    heart_icon = (
-        Image.open("src/resources/images/heart-solid.png")
-        .convert("RGBA")
-        .resize((80, 80), Image.LANCZOS)
-    )
+    heart_icon = get_heart_icon()
 
     padding = 40
     pill_height = 128
@@ -281,9 +265,9 @@ def draw_pills(image, pills):
 def draw_level(image, draw, level):
     # No idea how the hexagon design from flytes designs is meant to work
     # so we just draw the same image for everyone ¯\_(ツ)_/¯
-    level_hexagon = Image.open("src/resources/images/level-hexagon.png")
+    level_hexagon = get_level_hexagon()
     font_size = 64
-    font = ImageFont.truetype(TORUS_REGULAR, font_size)
+    font = get_font(TORUS_REGULAR, font_size)
     text_color = (255, 255, 255)
 
     hexagon_x = int(IMAGE_WIDTH // 1.18)
@@ -300,13 +284,7 @@ def draw_level(image, draw, level):
 
 
 def draw_flag(image, country_code):
-    unicode_hex = convert_country_code_to_unicode(country_code)
-    flag_path = f"src/resources/twemoji/{unicode_hex}.png"
-    if os.path.exists(flag_path):
-        country_flag = Image.open(flag_path).convert("RGBA")
-    else:
-        country_flag = Image.open("src/resources/images/unknown.png").convert("RGBA")
-        country_flag.thumbnail((72, 72), Image.LANCZOS)
+    country_flag = get_flag(country_code)
 
     x = int(IMAGE_WIDTH / 1.25)
     y = int((IMAGE_HEIGHT / 4 - country_flag.height) / 2)
@@ -320,8 +298,8 @@ def draw_join_date(draw, join_date):
     relative_time_string = f" ({relative_time}d ago)"
 
     font_size = 42
-    font = ImageFont.truetype(TORUS_REGULAR, font_size)
-    bold_font = ImageFont.truetype(TORUS_SEMIBOLD, font_size)
+    font = get_font(TORUS_REGULAR, font_size)
+    bold_font = get_font(TORUS_SEMIBOLD, font_size)
 
     x = int(IMAGE_WIDTH // 4.8)
     y = int(IMAGE_HEIGHT // 5.3)
@@ -1,10 +1,14 @@
 from PIL import Image
+import hashlib
 import io
+from collections import OrderedDict
 from colorsys import rgb_to_hsv, hsv_to_rgb
-import numpy as np
-from sklearn.cluster import KMeans
 from card.constants import TORUS_BOLD, TORUS_REGULAR, TORUS_SEMIBOLD
 
+# Avatar content hash -> header colour, the same avatar comes back card after card
+IMAGE_COLOR_CACHE_SIZE = 256
+image_colors = OrderedDict()
+
 
 # Colors taken from flyte's Tier Colours Design
 # https://www.figma.com/file/YHWhp9wZ089YXgB7pe6L1k/Tier-Colours
@@ -50,7 +54,9 @@ def get_rank_tier(rank):
 
 
 def fit_image_to_aspect_ratio(image_input, aspect_ratio):
-    if isinstance(image_input, str):
+    if isinstance(image_input, Image.Image):
+        image = image_input
+    elif isinstance(image_input, str):
         image = Image.open(image_input)
     else:
         image = Image.open(io.BytesIO(image_input))
@@ -76,25 +82,40 @@ def adjust_color_saturation_and_brightness(rgb_color, saturation, brightness):
 
 
 def get_image_color(image_data):
+    key = hashlib.sha1(image_data).digest()
+    if key in image_colors:
+        image_colors.move_to_end(key)
+        return image_colors[key]
+
+    color = get_dominant_color(image_data)
+    image_colors[key] = color
+    if len(image_colors) > IMAGE_COLOR_CACHE_SIZE:
+        image_colors.popitem(last=False)
+
+    return color
+
+
+def get_dominant_color(image_data):
     osu_pink = (255, 0, 115)
     try:
-        image = Image.open(io.BytesIO(image_data)).convert("RGB")
+        image = Image.open(io.BytesIO(image_data))
+        # jpegs can be decoded at a fraction of their size directly
+        image.draft("RGB", (64, 64))
+        image = image.convert("RGB")
     except (OSError, IOError):
         return adjust_color_saturation_and_brightness(osu_pink, 0.45, 0.3)
 
-    pixels = np.array(image).reshape(-1, 3)
+    # the palette of a thumbnail is as good as the full image for a tint
+    image.thumbnail((64, 64), Image.BILINEAR)
 
-    if len(pixels) < 5:
+    if image.width * image.height < 5:
         return adjust_color_saturation_and_brightness(osu_pink, 0.45, 0.3)
 
-    kmeans = KMeans(n_init=10, n_clusters=5)
-    kmeans.fit(pixels)
-
-    cluster_centers = kmeans.cluster_centers_
-
-    _, counts = np.unique(kmeans.labels_, return_counts=True)
+    quantized = image.quantize(colors=5, method=Image.MEDIANCUT)
+    _, index = max(quantized.getcolors())
+    palette = quantized.getpalette()
 
-    dominant_color = tuple(map(int, cluster_centers[np.argmax(counts)]))
+    dominant_color = tuple(palette[index * 3 : index * 3 + 3])
 
     if dominant_color == (255, 255, 255) or dominant_color == (0, 0, 0):
         dominant_color = osu_pink
@@ -1,18 +1,90 @@
+import io
+import threading
 from PIL import Image, ImageDraw
+from card.assets import get_card_template
 from card.constants import IMAGE_HEIGHT, IMAGE_WIDTH
-from card.background import draw_background
+from card.encode import encode_card
 from card.header import draw_header
 from card.body import draw_body
 
-image = Image.new("RGBA", (IMAGE_WIDTH, IMAGE_HEIGHT), (0, 0, 0, 0))
-draw = ImageDraw.Draw(image)
+# Gallery cards are tiled at half size, two per row
+GALLERY_COLUMNS = 2
+GALLERY_SCALE = 2
 
+# Canvases kept between renders, each render takes its own
+CANVAS_POOL_SIZE = 2
 
-# Card design is using flyte's Player Card design as a base and builds on top of it
-# https://www.figma.com/file/ocltATjJqWQZBravhPuqjB/UI%2FPlayer-Card
-def draw_card(user_data, avatar_data):
-    draw_background(draw)
-    draw_header(image, draw, user_data, avatar_data)
-    draw_body(image, user_data)
+canvas_pool = []
+canvas_pool_lock = threading.Lock()
 
-    return image
+
+def acquire_canvas():
+    with canvas_pool_lock:
+        if canvas_pool:
+            canvas = canvas_pool.pop()
+            # the template covers every pixel, nothing of the last card shows through
+            canvas.paste(get_card_template())
+            return canvas
+
+    return get_card_template().copy()
+
+
+def release_canvas(canvas):
+    with canvas_pool_lock:
+        if len(canvas_pool) < CANVAS_POOL_SIZE:
+            canvas_pool.append(canvas)
+
+
+class CardRenderer:
+    """Draws a card on a canvas of the pool, returned to it on exit. The image
+    must not be used after the with block."""
+
+    def __init__(self):
+        self.image = None
+        self.draw = None
+
+    def __enter__(self):
+        self.image = acquire_canvas()
+        self.draw = ImageDraw.Draw(self.image)
+        return self
+
+    def __exit__(self, *exc_info):
+        release_canvas(self.image)
+        self.image = None
+        self.draw = None
+
+    # Card design is using flyte's Player Card design as a base and builds on top of it
+    # https://www.figma.com/file/ocltATjJqWQZBravhPuqjB/UI%2FPlayer-Card
+    def render(self, user_data, avatar_data, cover_data=None):
+        draw_header(self.image, self.draw, user_data, avatar_data, cover_data)
+        draw_body(self.image, user_data)
+
+        return self.image
+
+
+def render_card(user_data, avatar_data, cover_data=None):
+    """Runs in a card worker, returns the encoded card and its file extension"""
+    with CardRenderer() as renderer:
+        image = renderer.render(user_data, avatar_data, cover_data)
+
+        return encode_card(image)
+
+
+def tile_cards(cards):
+    """Runs in a card worker, tiles encoded cards into one image and encodes it"""
+    tile_width = IMAGE_WIDTH // GALLERY_SCALE
+    tile_height = IMAGE_HEIGHT // GALLERY_SCALE
+    rows = (len(cards) + GALLERY_COLUMNS - 1) // GALLERY_COLUMNS
+    columns = min(len(cards), GALLERY_COLUMNS)
+    gallery = Image.new(
+        "RGBA", (tile_width * columns, tile_height * rows), (0, 0, 0, 0)
+    )
+
+    for i, (image_data, _) in enumerate(cards):
+        card = Image.open(io.BytesIO(image_data)).convert("RGBA")
+        card = card.resize((tile_width, tile_height), resample=Image.LANCZOS)
+        x = (i % GALLERY_COLUMNS) * tile_width
+        y = (i // GALLERY_COLUMNS) * tile_height
+        gallery.paste(card, (x, y))
+
+    return encode_card(gallery)
@@ -0,0 +1,53 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Processes rendering cards, CARD_WORKERS in .env
+CARD_WORKERS = 2
+
+executor = None
+
+
+def init_worker():
+    # Loads the drawing code, fonts and icons once per worker, not on the first render
+    import card.image
+    from card.assets import preload_assets
+
+    preload_assets()
+
+
+def get_worker_count():
+    return int(os.getenv("CARD_WORKERS", CARD_WORKERS))
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        # spawned workers don't inherit the bot's event loop and connections
+        executor = ProcessPoolExecutor(
+            max_workers=get_worker_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        )
+
+    return executor
+
+
+def start_card_workers():
+    """Starts the workers ahead of the first render"""
+    pool = get_executor()
+    for _ in range(get_worker_count()):
+        pool.submit(int)
+
+
+async def run_in_worker(function, *args):
+    global executor
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_executor(), function, *args)
+    except BrokenProcessPool:
+        # a worker died mid render, the next render starts a new pool
+        executor = None
+        raise
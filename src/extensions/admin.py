@@ -1,5 +1,6 @@
 from discord.ext import commands
 from utils.helpers import get_args
+from utils.announcer import notify_announcement
 import sys
 import subprocess
 
@@ -23,6 +24,17 @@ class Admin(commands.Cog):
         await ctx.message.add_reaction("👍")
         sys.exit()
 
+    @commands.command()
+    @commands.has_permissions(kick_members=True)
+    async def testannounce(self, ctx, *args):
+        """Notifies the announcer of a feed entry"""
+        di = get_args(args)
+        if not (di.get("-b") and di.get("-u")):
+            raise ValueError("Please specify a beatmap with -b and a user id with -u")
+
+        await notify_announcement(di.get("-type", "newfcs"), di["-b"], di["-u"])
+        await ctx.message.add_reaction("👍")
+
 
 async def setup(bot):
     await bot.add_cog(Admin(bot))
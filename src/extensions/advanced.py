@@ -132,20 +132,6 @@ class Advanced(commands.Cog):
         if user_id is not None and not kwargs.get("-user") and kwargs.get("-nolist"):
             kwargs["-user"] = user_id
 
-        combo_score_multiplier = "500000"
-        acc_score_multipülier = "500000"
-
-        accuracy_formula = "((50 * scores.count50 + 100 * scores.count100 + 300 * scores.count300) / (300 * scores.count50 + 300 * scores.count100 + 300 * scores.count300 + 300 * scores.countmiss)::float)"
-        combo_formula = "(scores.combo/beatmaps.maxcombo::float)"
-
-        standardised_formula = f"""({combo_score_multiplier} * {accuracy_formula} * {combo_formula}) + 
-                                ({acc_score_multipülier} * ({accuracy_formula} ^ 5))"""
-
-        standardised = f"({standardised_formula} * mods.multiplier)"
-        standardised_nomod = f"({standardised_formula})"
-        max_score = "1000000"
-        totalHitObjects = "(beatmaps.circles + beatmaps.spinners + beatmaps.sliders)"
-
         if kwargs.get("-o"):
             if title == "Result":
                 title = escape_markdown(kwargs["-o"])
@@ -231,7 +217,7 @@ class Advanced(commands.Cog):
             elif kwargs["-o"] == "lazerscore":
                 await check_tables(
                     ctx,
-                    f"SUM((POW((({standardised} / {max_score}) * {totalHitObjects}), 2) * 32.57 + 100000)::bigint)",
+                    "SUM(score_metrics.lazerscore)",
                     "scores",
                     kwargs,
                     "Lazer Classic Score",
@@ -240,7 +226,7 @@ class Advanced(commands.Cog):
             elif kwargs["-o"] == "lazerscore_nomod":
                 await check_tables(
                     ctx,
-                    f"SUM((POW((({standardised_nomod} / {max_score}) * {totalHitObjects}), 2) * 32.57 + 100000)::bigint)",
+                    "SUM(score_metrics.lazerscore_nomod)",
                     "scores",
                     kwargs,
                     "Lazer Classic Score without mod multipliers",
@@ -250,7 +236,7 @@ class Advanced(commands.Cog):
                 kwargs["-o"] = "lazerscore"
                 await check_tables(
                     ctx,
-                    f"SUM({standardised})",
+                    "SUM(score_metrics.standardised)",
                     "scores",
                     kwargs,
                     "Lazer Standardised Score",
@@ -259,7 +245,7 @@ class Advanced(commands.Cog):
             elif kwargs["-o"] == "lazerscore_standard_nomod":
                 await check_tables(
                     ctx,
-                    f"SUM({standardised_nomod})",
+                    "SUM(score_metrics.standardised_nomod)",
                     "scores",
                     kwargs,
                     "Lazer Standardised Score without mod multipliers",
@@ -268,7 +254,7 @@ class Advanced(commands.Cog):
             elif kwargs["-o"] == "agedscore":
                 await check_tables(
                     ctx,
-                    "sum(score * (DATE_PART('year', NOW() - approved_date) + DATE_PART('day', NOW() - approved_date) / 365.2425))",
+                    "sum(scores.score * (CURRENT_DATE - DATE '1970-01-01') - score_metrics.score_days) / 365.2425",
                     "scores",
                     kwargs,
                     "Aged Score",
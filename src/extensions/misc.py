@@ -8,13 +8,18 @@ from sql.queries import (
     insert_into_scorequeue,
 )
 from utils.misc import generateosdb, getfile
-from card.data import get_card
+from card.data import get_card, get_gallery
+from card.fetch import close_session
 
 
 class Misc(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_unload(self):
+        # runs when the bot closes, the card image session goes with it
+        await close_session()
+
     @commands.command()
     async def queuelength(self, ctx):
         """Checks how long the !queue will take"""
@@ -69,6 +74,13 @@ class Misc(commands.Cog):
         embed, file = await get_card(user_id, kwargs)
         await ctx.reply(embed=embed, file=file)
 
+    @commands.command()
+    async def gallery(self, ctx, *args):
+        """Generates the cards of up to 10 users, from -users or the top players by -o. Use -tile true for a single image."""
+        kwargs = get_args(args)
+        embed, files = await get_gallery(kwargs)
+        await ctx.reply(embed=embed, files=files)
+
 
 async def setup(bot):
     await bot.add_cog(Misc(bot))
@@ -1,6 +1,7 @@
 from discord.ext import commands
 from utils.helpers import get_args
 from sql.queries import get_profile_leaderboard, get_ppv1_leaderboard
+from utils.whatif import whatif_pp
 
 
 class Performance(commands.Cog):
@@ -71,6 +72,12 @@ class Performance(commands.Cog):
 
         await get_ppv1_leaderboard(ctx, "accuracyv1", "ppv1 Accuracy", **kwargs)
 
+    @commands.command(aliases=["ppif"])
+    async def whatif(self, ctx, *args):
+        """Profile pp if you set new plays"""
+        kwargs = get_args(args)
+        await whatif_pp(ctx, kwargs)
+
 
 async def setup(bot):
     await bot.add_cog(Performance(bot))
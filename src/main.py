@@ -4,7 +4,8 @@ import os
 import sys
 import traceback
 from dotenv import load_dotenv
-from utils.misc import updatelists
+from utils.announcer import start_announcer
+from card.worker import start_card_workers
 
 load_dotenv()
 
@@ -36,6 +37,9 @@ async def setup_hook() -> None:
         if filename.endswith(".py") and filename != "__init__.py":
             await bot.load_extension(f"extensions.{filename[:-3]}")
 
+    start_announcer(bot)
+    start_card_workers()
+
 
 @bot.event
 async def on_ready():
@@ -66,9 +70,6 @@ async def on_command_error(ctx, error):
     await ctx.reply(embed=embed)
 
 
-@bot.event
-async def on_command_completion(ctx):
-    await updatelists(bot)
-
-
-bot.run(DISCORD_TOKEN)
+# Card workers are spawned processes that import this module again
+if __name__ == "__main__":
+    bot.run(DISCORD_TOKEN)
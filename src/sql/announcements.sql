@@ -0,0 +1,46 @@
+-- Notifies the bot of new entries in the announcement feeds, run this file once.
+-- The bot listens on new_announcements and announces the entry right away,
+-- entries it misses are picked up by its periodic sweep.
+--
+-- To test without the tracker:
+-- NOTIFY new_announcements, '{"feed": "newfcs", "beatmap_id": 1, "user_id": 2}';
+
+CREATE OR REPLACE FUNCTION notify_new_announcement() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify(
+        'new_announcements',
+        json_build_object(
+            'feed', TG_TABLE_NAME,
+            'beatmap_id', NEW.beatmap_id,
+            'user_id', NEW.user_id
+        )::text
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notify_new_announcement ON newfcs;
+CREATE TRIGGER notify_new_announcement
+AFTER INSERT ON newfcs
+FOR EACH ROW EXECUTE FUNCTION notify_new_announcement();
+
+DROP TRIGGER IF EXISTS notify_new_announcement ON newSSs;
+CREATE TRIGGER notify_new_announcement
+AFTER INSERT ON newSSs
+FOR EACH ROW EXECUTE FUNCTION notify_new_announcement();
+
+DROP TRIGGER IF EXISTS notify_new_announcement ON newdtfcs;
+CREATE TRIGGER notify_new_announcement
+AFTER INSERT ON newdtfcs
+FOR EACH ROW EXECUTE FUNCTION notify_new_announcement();
+
+-- Announcements waiting to be sent. Entries move here from the feeds in the
+-- same statement that deletes them, rows are removed once the message is sent.
+CREATE TABLE IF NOT EXISTS announcement_outbox (
+    id bigserial PRIMARY KEY,
+    channel_id bigint NOT NULL,
+    embed jsonb NOT NULL,
+    -- set before sending, checked against the channel after a crash
+    attempted boolean NOT NULL DEFAULT false,
+    created_at timestamp NOT NULL DEFAULT now()
+);
@@ -7,14 +7,21 @@ import os
 class Database:
     def __init__(self):
         self.pool = None
+        # Speculative queries, cancelled as soon as the pool runs short
+        self.background_tasks = set()
+
+    def get_connection_args(self):
+        return {
+            "host": os.getenv("DB_HOST"),
+            "database": os.getenv("DB_NAME"),
+            "user": os.getenv("DB_USER"),
+            "password": os.getenv("DB_PASSWORD"),
+        }
 
     async def get_pool(self):
         if self.pool is None:
             self.pool = await asyncpg.create_pool(
-                host=os.getenv("DB_HOST"),
-                database=os.getenv("DB_NAME"),
-                user=os.getenv("DB_USER"),
-                password=os.getenv("DB_PASSWORD"),
+                **self.get_connection_args(),
                 min_size=1,
                 max_size=10,
                 max_queries=50000,
@@ -24,9 +31,26 @@ class Database:
 
         return self.pool
 
+    def has_spare_connection(self):
+        """True while at least two connections are idle or can still be opened,
+        background queries never take the last one"""
+        if self.pool is None:
+            return False
+        pool = self.pool
+        free = pool.get_idle_size() + pool.get_max_size() - pool.get_size()
+        return free > 1
+
     async def execute_query(self, query, *params):
         pool = await self.get_pool()
 
+        if (
+            self.background_tasks
+            and asyncio.current_task() not in self.background_tasks
+            and not self.has_spare_connection()
+        ):
+            for task in self.background_tasks:
+                task.cancel()
+
         try:
             async with pool.acquire() as connection:
                 async with connection.transaction():
@@ -35,6 +59,22 @@ class Database:
         except asyncio.TimeoutError:
             raise asyncio.TimeoutError("Query timed out")
 
+    async def execute_background(self, query, *params):
+        task = asyncio.current_task()
+        self.background_tasks.add(task)
+        try:
+            return await self.execute_query(query, *params)
+        finally:
+            self.background_tasks.discard(task)
+
+    async def listen(self, channel, callback):
+        """Opens a connection outside the pool, notifications only arrive on the
+        connection that ran LISTEN. The caller closes it."""
+        connection = await asyncpg.connect(**self.get_connection_args())
+        await connection.add_listener(channel, callback)
+
+        return connection
+
     async def export_to_csv(self, query, filename, *params):
         pool = await self.get_pool()
 
@@ -7,14 +7,42 @@ import discord
 from .db import Database
 from utils.helpers import (
     build_where_clause,
+    cached_builder,
+    get_filter_users,
     unique_tables,
     get_mods_string,
     normalize_year,
 )
 from utils.format import format_leaderboard, format_footer
+from utils.search import BEATMAP_IDS
+from utils.pagination import (
+    CACHE_ROWS,
+    get_cached_result,
+    get_prefetched_result,
+    prefetch_result,
+    set_cached_result,
+    reply_paginated,
+)
 
 db = Database()
 
+# -o values read from the precomputed score_metrics table, see score_metrics.sql
+score_metrics_options = [
+    "lazerscore",
+    "lazerscore_nomod",
+    "lazerscore_standard_nomod",
+    "agedscore",
+]
+
+# filters on the scores of other users, value is whether the map has to be played
+user_filters = {
+    "-ssed-by": True,
+    "-cleared-by": True,
+    "-uncleared-by": False,
+}
+# Above this many beatmaps the combined user filters are left as separate EXISTS
+MAX_USER_FILTER_IDS = 20000
+
 blacklist = [
     "-is_fc",
     "-is_ss",
@@ -140,12 +168,11 @@ async def check_profile(ctx, stat, di, ppv1=False):
         base = base + " inner join users_ppv1 using (user_id)"
     base = base + build_where_clause(di)
 
-    # build and execute the leaderboard creating query
+    # build the leaderboard creating query
     query = await build_leaderboard(ctx, base, di)
     print(query)
-    result = await db.execute_query(query)
 
-    return result
+    return query
 
 
 async def check_mappers(ctx, stat, di):
@@ -154,62 +181,26 @@ async def check_mappers(ctx, stat, di):
     base = base + build_where_clause(di)
     base = base + " group by username, user_id"
 
-    # build and execute the leaderboard creating query
+    # build the leaderboard creating query
     query = await build_leaderboard(ctx, base, di)
     print(query)
-    result = await db.execute_query(query)
 
-    return result
+    return query
 
 
 async def get_mapper_leaderboard(ctx, stat, title, **kwargs):
-    query_start_time = time.time()
-    rows = await check_mappers(ctx, stat, kwargs)
-    query_end_time = time.time()
-    query_execution_time = round(query_end_time - query_start_time, 2)
-    embed = format_leaderboard(rows, kwargs)
-
-    embed.title = title
-    footer_text = format_footer("profile", query_execution_time, embed.description)
-    embed.set_footer(
-        text=footer_text,
-        icon_url="https://pek.li/maj7qa.png",
-    )
-
-    await ctx.reply(embed=embed)
+    query = await check_mappers(ctx, stat, kwargs)
+    await reply_leaderboard(ctx, query, kwargs, title, "profile")
 
 
 async def get_profile_leaderboard(ctx, stat, title, **kwargs):
-    query_start_time = time.time()
-    rows = await check_profile(ctx, stat, kwargs)
-    query_end_time = time.time()
-    query_execution_time = round(query_end_time - query_start_time, 2)
-    embed = format_leaderboard(rows, kwargs)
-
-    embed.title = title
-    footer_text = format_footer("profile", query_execution_time, embed.description)
-    embed.set_footer(
-        text=footer_text,
-        icon_url="https://pek.li/maj7qa.png",
-    )
-
-    await ctx.reply(embed=embed)
+    query = await check_profile(ctx, stat, kwargs)
+    await reply_leaderboard(ctx, query, kwargs, title, "profile")
 
 
 async def get_ppv1_leaderboard(ctx, stat, title, **kwargs):
-    query_start_time = time.time()
-    rows = await check_profile(ctx, stat, kwargs, True)
-    query_end_time = time.time()
-    query_execution_time = round(query_end_time - query_start_time, 2)
-    embed = format_leaderboard(rows, kwargs)
-
-    embed.title = title
-    embed.set_footer(
-        text=f"Updated every ~30min • took {query_execution_time}s",
-        icon_url="https://pek.li/maj7qa.png",
-    )
-
-    await ctx.reply(embed=embed)
+    query = await check_profile(ctx, stat, kwargs, True)
+    await reply_leaderboard(ctx, query, kwargs, title, "ppv1")
 
 
 async def check_array_stats(ctx, operation, table, aggregate, di, title=None):
@@ -221,29 +212,16 @@ async def check_array_stats(ctx, operation, table, aggregate, di, title=None):
 
     query = await build_leaderboard(ctx, base, di)
     print(query)
-    query_start_time = time.time()
-    rows = await db.execute_query(query)
-    query_end_time = time.time()
-    query_execution_time = round(query_end_time - query_start_time, 2)
 
     if title == None:
         title = "Result"
 
-    embed = format_leaderboard(rows, di)
-    embed.title = title
-    footer_text = format_footer("profile", query_execution_time, embed.description)
-    embed.set_footer(
-        text=footer_text,
-        icon_url="https://pek.li/maj7qa.png",
-    )
+    await reply_leaderboard(ctx, query, di, title, "profile")
 
-    await ctx.reply(embed=embed)
 
-
-async def check_tables(ctx, operation, table, di, embedtitle=None):
-    base = f"select scores.user_id, {operation} as stat from {table} \
-            inner join users2 on {table}.user_id = users2.user_id \
-            inner join beatmaps on {table}.beatmap_id = beatmaps.beatmap_id"
+@cached_builder
+def build_table_joins(di, table):
+    base = ""
 
     if (
         di.get("-pack")
@@ -293,7 +271,16 @@ async def check_tables(ctx, operation, table, di, embedtitle=None):
             + " inner join (select beatmap_id, top_score_nomod from top_score_nomod) top_score_nomod on beatmaps.beatmap_id = top_score_nomod.beatmap_id"
         )
 
-    if di.get("-o") and di["-o"] == "lazerscore":
+    if di.get("-o") in score_metrics_options:
+        base = (
+            base
+            + " inner join score_metrics on scores.user_id = score_metrics.user_id and scores.beatmap_id = score_metrics.beatmap_id"
+        )
+
+    # mods is only needed to filter on the multiplier, the metrics are precomputed
+    if di.get("-o") == "lazerscore" and (
+        di.get("-multiplier") or di.get("not-multiplier")
+    ):
         base = base + " inner join mods on scores.enabled_mods = mods.enum"
 
     if di.get("-rank"):
@@ -313,6 +300,16 @@ async def check_tables(ctx, operation, table, di, embedtitle=None):
             + f" inner join scores on {table}.beatmap_id = scores.beatmap_id and {table}.user_id = scores.user_id"
         )
 
+    return base
+
+
+async def check_tables(ctx, operation, table, di, embedtitle=None):
+    await resolve_user_filters(di)
+    base = f"select scores.user_id, {operation} as stat from {table} \
+            inner join users2 on {table}.user_id = users2.user_id \
+            inner join beatmaps on {table}.beatmap_id = beatmaps.beatmap_id"
+    base = base + build_table_joins(di, table)
+
     options = [
         "completion",
         "%",
@@ -376,10 +373,6 @@ async def check_tables(ctx, operation, table, di, embedtitle=None):
     print("base: ", base)
     query = await build_leaderboard(ctx, base, di)
     print("query:", query)
-    query_start_time = time.time()
-    rows = await db.execute_query(query)
-    query_end_time = time.time()
-    query_execution_time = round(query_end_time - query_start_time, 2)
 
     if embedtitle == None:
         embedtitle = "Result"
@@ -390,18 +383,11 @@ async def check_tables(ctx, operation, table, di, embedtitle=None):
         if mapsets:
             embedtitle += "ets"
 
-    embed = format_leaderboard(rows, di)
-    embed.title = embedtitle
-    footer_text = format_footer("scores", query_execution_time, embed.description)
-    embed.set_footer(
-        text=footer_text,
-        icon_url="https://pek.li/maj7qa.png",
-    )
-
-    await ctx.reply(embed=embed)
+    await reply_leaderboard(ctx, query, di, embedtitle, "scores")
 
 
 async def check_beatmaps(ctx, di, tables=None, sets=False):
+    await resolve_user_filters(di)
     for key in di.copy().keys():
         if key in blacklist:
             if (key == "-user" or key == "-u") and "-unplayed" in di:
@@ -504,6 +490,7 @@ async def check_beatmaps(ctx, di, tables=None, sets=False):
 
 
 async def check_weighted_pp(ctx, operation, di, embedtitle=None):
+    await resolve_user_filters(di)
     table = "select scores.user_id, scores.beatmap_id, scores.pp, scores.accuracy, ROW_NUMBER() OVER(partition by scores.user_id order by scores.pp desc) as pp_index from scores inner join users2 on scores.user_id = users2.user_id inner join beatmaps on scores.beatmap_id = beatmaps.beatmap_id"
 
     if di.get("-o") and di["-o"] == "ppv1":
@@ -571,23 +558,11 @@ async def check_weighted_pp(ctx, operation, di, embedtitle=None):
 
     print(query)
 
-    query_start_time = time.time()
-    rows = await db.execute_query(query)
-    query_end_time = time.time()
-    query_execution_time = round(query_end_time - query_start_time, 2)
-
-    embed = format_leaderboard(rows, di)
-    embed.title = embedtitle
-    footer_text = format_footer("scores", query_execution_time, embed.description)
-    embed.set_footer(
-        text=footer_text,
-        icon_url="https://pek.li/maj7qa.png",
-    )
-
-    await ctx.reply(embed=embed)
+    await reply_leaderboard(ctx, query, di, embedtitle, "scores")
 
 
 async def check_weighted_score(ctx, operation, di, embedtitle=None):
+    await resolve_user_filters(di)
     table = "select scores.user_id, scores.beatmap_id, scores.score, ROW_NUMBER() OVER(partition by scores.user_id order by score desc) as score_index from scores inner join beatmaps on scores.beatmap_id = beatmaps.beatmap_id inner join users2 on scores.user_id = users2.user_id"
 
     if (
@@ -634,20 +609,92 @@ async def check_weighted_score(ctx, operation, di, embedtitle=None):
     query = await build_leaderboard(ctx, base, di)
 
     print(query)
-    query_start_time = time.time()
-    rows = await db.execute_query(query)
-    query_end_time = time.time()
-    query_execution_time = round(query_end_time - query_start_time, 2)
+    await reply_leaderboard(ctx, query, di, embedtitle, "scores")
 
-    embed = format_leaderboard(rows, di)
-    embed.title = embedtitle
-    footer_text = format_footer("scores", query_execution_time, embed.description)
-    embed.set_footer(
-        text=footer_text,
-        icon_url="https://pek.li/maj7qa.png",
-    )
 
-    await ctx.reply(embed=embed)
+@cached_builder
+def build_beatmap_joins(di, tables):
+    """Joins shared by the count and page queries of get_beatmap_list, along
+    with the unique table the where clause filters the user on"""
+    joins = ""
+    unique_table = None
+    if tables != None:
+        for table in tables:
+            if table == "mods":
+                joins = (
+                    joins
+                    + " inner join "
+                    + table
+                    + " on scores.enabled_mods = "
+                    + table
+                    + ".enum"
+                )
+            elif table == "score_metrics":
+                joins = (
+                    joins
+                    + " inner join score_metrics on scores.user_id = score_metrics.user_id and scores.beatmap_id = score_metrics.beatmap_id"
+                )
+            else:
+                joins = joins + " inner join " + table + " using (beatmap_id)"
+            if table in unique_tables:
+                joins = (
+                    joins
+                    + f" inner join scores on {table}.beatmap_id = scores.beatmap_id and {table}.user_id = scores.user_id"
+                )
+                unique_table = table
+    if (
+        di.get("-pack")
+        or di.get("-pack-min")
+        or di.get("-pack-max")
+        or di.get("-packs")
+        or di.get("-apacks")
+    ):
+        joins = (
+            joins
+            + " inner join beatmap_packs on beatmaps.beatmap_id = beatmap_packs.beatmap_id"
+        )
+    if di["-mode"] == "0":
+        if tables == None:
+            if (di.get("-o") and di["-o"] == "nomodscore") or (
+                di.get("-topscorenomod") or di.get("-topscorenomod-max")
+            ):
+                joins = (
+                    joins
+                    + " inner join (select beatmap_id, top_score_nomod from top_score_nomod) top_score_nomod on beatmaps.beatmap_id = top_score_nomod.beatmap_id"
+                )
+            else:
+                joins = (
+                    joins
+                    + " inner join (select beatmap_id, top_score from top_score) top_score on beatmaps.beatmap_id = top_score.beatmap_id"
+                )
+        elif not ("top_score" in tables or "top_score_nomod" in tables):
+            if (di.get("-o") and di["-o"] == "nomodscore") or (
+                di.get("-topscorenomod") or di.get("-topscorenomod-max")
+            ):
+                joins = (
+                    joins
+                    + " inner join (select beatmap_id, top_score_nomod from top_score_nomod) top_score_nomod on beatmaps.beatmap_id = top_score_nomod.beatmap_id"
+                )
+            else:
+                joins = (
+                    joins
+                    + " inner join (select beatmap_id, top_score from top_score) top_score on beatmaps.beatmap_id = top_score.beatmap_id"
+                )
+    if di.get("-rank"):
+        joins = (
+            joins
+            + " inner join (select beatmap_id, user_id from top_score) firsts on beatmaps.beatmap_id = firsts.beatmap_id"
+        )
+
+    # if di.get("-modded") and di["-modded"] == "true":
+    #     joins = joins + " inner join moddedsr on beatmaps.beatmap_id = moddedsr.beatmap_id and greatest(0, (case when is_dt = 'true' then 64 else 0 end + case when is_hr = 'true' then 16 else 0 end + case when is_ez = 'true' then 2 else 0 end + case when is_fl = 'true' then 1024 else 0 end)) = moddedsr.mods_enum"
+
+    if di.get("-modded") and di["-modded"] == "true":
+        joins = (
+            joins + " inner join moddedsr on beatmaps.beatmap_id = moddedsr.beatmap_id"
+        )
+
+    return joins, unique_table
 
 
 async def get_beatmap_list(
@@ -659,11 +706,11 @@ async def get_beatmap_list(
     missingScore=False,
     returnCount=False,
 ):
+    await resolve_user_filters(di)
     limit = 10
     page = 1
     order = "stars"
     direction = "asc"
-    unique_table = None
     if di.get("-order"):
         if di["-order"] == "date":
             di["-order"] = "date_played"
@@ -680,14 +727,9 @@ async def get_beatmap_list(
         if di["-order"] == "lazerscore":
             if not di.get("-direction") or di.get("-dir"):
                 di["-direction"] = "desc"
-            standardised = "(((((50 * scores.count50 + 100 * scores.count100 + 300 * scores.count300) / (300 * scores.count50 + 300 * scores.count100 + 300 * scores.count300 + 300 * scores.countmiss)::float) * 300000) + ((scores.combo/beatmaps.maxcombo::float)*700000)) * mods.multiplier)"
-            max_score = "1000000"
-            totalHitObjects = (
-                "(beatmaps.circles + beatmaps.spinners + beatmaps.sliders)"
-            )
-            di["-order"] = (
-                f"(POW((({standardised} / {max_score}) * {totalHitObjects}), 2) * 36)::int"
-            )
+            di["-order"] = "score_metrics.lazerscore_old"
+            if tables != None and "scores" in tables:
+                tables = tables + ["score_metrics"]
         if (
             di["-order"] == "score"
             or di["-order"] == "pp"
@@ -738,83 +780,14 @@ async def get_beatmap_list(
     elif returnCount and (di.get("-o") == "score" or di.get("-o") == "nomodscore"):
         count_query = "select sum(scores.score)"
 
-    count_query = count_query + " from beatmaps"
-    if tables != None:
-        for table in tables:
-            if table == "mods":
-                count_query = (
-                    count_query
-                    + " inner join "
-                    + table
-                    + " on scores.enabled_mods = "
-                    + table
-                    + ".enum"
-                )
-            else:
-                count_query = (
-                    count_query + " inner join " + table + " using (beatmap_id)"
-                )
-            if table in unique_tables:
-                count_query = (
-                    count_query
-                    + f" inner join scores on {table}.beatmap_id = scores.beatmap_id and {table}.user_id = scores.user_id"
-                )
-                unique_table = table
-
-    if (
-        di.get("-pack")
-        or di.get("-pack-min")
-        or di.get("-pack-max")
-        or di.get("-packs")
-        or di.get("-apacks")
-    ):
-        count_query = (
-            count_query
-            + " inner join beatmap_packs on beatmaps.beatmap_id = beatmap_packs.beatmap_id"
-        )
-    if di["-mode"] == "0":
-        if tables == None:
-            if (di.get("-o") and di["-o"] == "nomodscore") or (
-                di.get("-topscorenomod") or di.get("-topscorenomod-max")
-            ):
-                count_query = (
-                    count_query
-                    + " inner join (select beatmap_id, top_score_nomod from top_score_nomod) top_score_nomod on beatmaps.beatmap_id = top_score_nomod.beatmap_id"
-                )
-            else:
-                count_query = (
-                    count_query
-                    + " inner join (select beatmap_id, top_score from top_score) top_score on beatmaps.beatmap_id = top_score.beatmap_id"
-                )
-        elif not ("top_score" in tables or "top_score_nomod" in tables):
-            if (di.get("-o") and di["-o"] == "nomodscore") or (
-                di.get("-topscorenomod") or di.get("-topscorenomod-max")
-            ):
-                count_query = (
-                    count_query
-                    + " inner join (select beatmap_id, top_score_nomod from top_score_nomod) top_score_nomod on beatmaps.beatmap_id = top_score_nomod.beatmap_id"
-                )
-            else:
-                count_query = (
-                    count_query
-                    + " inner join (select beatmap_id, top_score from top_score) top_score on beatmaps.beatmap_id = top_score.beatmap_id"
-                )
-
-    if di.get("-rank"):
-        count_query = (
-            count_query
-            + " inner join (select beatmap_id, user_id from top_score) firsts on beatmaps.beatmap_id = firsts.beatmap_id"
-        )
-
-    if di.get("-modded") and di["-modded"] == "true":
-        count_query = (
-            count_query
-            + " inner join moddedsr on beatmaps.beatmap_id = moddedsr.beatmap_id"
-        )
-
+    joins, unique_table = build_beatmap_joins(di, tables)
+    count_query = count_query + " from beatmaps" + joins
     count_query = count_query + build_where_clause(di, unique_table)
     print("Count query: " + count_query)
-    count_res = await db.execute_query(count_query)
+    count_res = get_cached_result(count_query)
+    if count_res is None:
+        count_res = await db.execute_query(count_query)
+        set_cached_result(count_query, count_res)
     if len(count_res) > 0:
         count = count_res[0][0]
     if returnCount == True:
@@ -831,111 +804,179 @@ async def get_beatmap_list(
         query = "select set_id, max(beatmaps.beatmap_id) as beatmap_id, max(beatmaps.artist) as artist, max(beatmaps.title) as title, max(beatmaps.diffname) as diffname, max(beatmaps.stars) as stars"
         if bonusColumn != None:
             query = query + ", max(" + bonusColumn + ") as bonuscolumn"
-    query = query + " from beatmaps"
-    if tables != None:
-        for table in tables:
-            if table == "mods":
-                query = (
-                    query
-                    + " inner join "
-                    + table
-                    + " on scores.enabled_mods = "
-                    + table
-                    + ".enum"
-                )
-            else:
-                query = query + " inner join " + table + " using (beatmap_id)"
-            if table in unique_tables:
-                query = (
-                    query
-                    + f" inner join scores on {table}.beatmap_id = scores.beatmap_id and {table}.user_id = scores.user_id"
-                )
-    if (
-        di.get("-pack")
-        or di.get("-pack-min")
-        or di.get("-pack-max")
-        or di.get("-packs")
-        or di.get("-apacks")
-    ):
-        query = (
-            query
-            + " inner join beatmap_packs on beatmaps.beatmap_id = beatmap_packs.beatmap_id"
-        )
-    if di["-mode"] == "0":
-        if tables == None:
-            if (di.get("-o") and di["-o"] == "nomodscore") or (
-                di.get("-topscorenomod") or di.get("-topscorenomod-max")
-            ):
-                query = (
-                    query
-                    + " inner join (select beatmap_id, top_score_nomod from top_score_nomod) top_score_nomod on beatmaps.beatmap_id = top_score_nomod.beatmap_id"
-                )
-            else:
-                query = (
-                    query
-                    + " inner join (select beatmap_id, top_score from top_score) top_score on beatmaps.beatmap_id = top_score.beatmap_id"
-                )
-        elif not ("top_score" in tables or "top_score_nomod" in tables):
-            if (di.get("-o") and di["-o"] == "nomodscore") or (
-                di.get("-topscorenomod") or di.get("-topscorenomod-max")
-            ):
-                query = (
-                    query
-                    + " inner join (select beatmap_id, top_score_nomod from top_score_nomod) top_score_nomod on beatmaps.beatmap_id = top_score_nomod.beatmap_id"
-                )
-            else:
-                query = (
-                    query
-                    + " inner join (select beatmap_id, top_score from top_score) top_score on beatmaps.beatmap_id = top_score.beatmap_id"
-                )
-    if di.get("-rank"):
-        query = (
-            query
-            + " inner join (select beatmap_id, user_id from top_score) firsts on beatmaps.beatmap_id = firsts.beatmap_id"
-        )
+    query = query + " from beatmaps" + joins
+    where = build_where_clause(di, unique_table)
+    group = ""
+    if sets:
+        group = " group by set_id"
+    if missingScore:
+        group = " group by set_id, beatmaps.beatmap_id, artist, title, diffname, stars"
+        if not di.get("-unplayed"):
+            group = group + ", score"
+        total_missing_query = query + where + group
+
+    limit = int(limit)
+    page = int(page)
+    page_count = math.ceil(int(count) / limit)
+
+    # Sort columns that can be paged with a (column, artist, beatmap_id) keyset,
+    # mapped to the index of the column in the result rows
+    keyset_columns = {
+        "stars": (
+            "moddedsr.star_rating::numeric"
+            if di.get("-modded") and di["-modded"] == "true"
+            else "stars",
+            5,
+        ),
+        "set_id": ("set_id", 0),
+        "beatmap_id": ("beatmaps.beatmap_id", 1),
+        "beatmaps.beatmap_id": ("beatmaps.beatmap_id", 1),
+        "artist": ("artist", 2),
+        "title": ("title", 3),
+        "diffname": ("diffname", 4),
+    }
+    keyset = None
+    if not sets and order in keyset_columns and direction in ("asc", "desc"):
+        keyset = keyset_columns[order]
+
+    order_by = " order by " + order + " " + direction + ", artist"
+    if not sets:
+        order_by += ", beatmaps.beatmap_id"
+
+    async def fetch_rows(query, *params):
+        print("Query: " + query)
+        rows = await get_prefetched_result((query, params))
+        if rows is None:
+            rows = await db.execute_query(query, *params)
+            set_cached_result((query, params), rows)
+
+        return rows
+
+    def get_page_query(page, token):
+        if not (keyset and isinstance(token, tuple)):
+            return (
+                query
+                + where
+                + group
+                + order_by
+                + " limit "
+                + str(limit)
+                + " offset "
+                + str(limit * (page - 1)),
+                (),
+            )
 
-    # if di.get("-modded") and di["-modded"] == "true":
-    #     query = query + " inner join moddedsr on beatmaps.beatmap_id = moddedsr.beatmap_id and greatest(0, (case when is_dt = 'true' then 64 else 0 end + case when is_hr = 'true' then 16 else 0 end + case when is_ez = 'true' then 2 else 0 end + case when is_fl = 'true' then 1024 else 0 end)) = moddedsr.mods_enum"
+        # Rows after (or before) the key of the last (or first) row of the current page
+        token_direction, key = token
+        forward = (token_direction == "next") == (direction == "asc")
+        op = ">" if forward else "<"
+        tie_op = ">" if token_direction == "next" else "<"
+        predicate = f"({keyset[0]} {op} $1 or ({keyset[0]} = $1 and (artist {tie_op} $2 or (artist = $2 and beatmaps.beatmap_id {tie_op} $3))))"
+        keyset_where = (where + " and " if where else " where ") + predicate
 
-    if di.get("-modded") and di["-modded"] == "true":
-        query = (
-            query + " inner join moddedsr on beatmaps.beatmap_id = moddedsr.beatmap_id"
-        )
+        if token_direction == "next":
+            keyset_order = order_by
+        else:
+            keyset_order = (
+                " order by "
+                + order
+                + " "
+                + ("desc" if direction == "asc" else "asc")
+                + ", artist desc, beatmaps.beatmap_id desc"
+            )
 
-    query = query + build_where_clause(di, unique_table)
-    if sets:
-        query = query + " group by set_id"
-    if missingScore:
-        query = (
-            query
-            + " group by set_id, beatmaps.beatmap_id, artist, title, diffname, stars"
+        return (
+            query + keyset_where + group + keyset_order + " limit " + str(limit),
+            key,
         )
-        if not di.get("-unplayed"):
-            query = query + ", score"
-        total_missing_query = query
-    query = (
-        query
-        + " order by "
-        + order
-        + " "
-        + direction
-        + ", artist limit "
-        + str(limit)
-        + " offset "
-        + str(offset)
-    )
-    print("Query: " + query)
+
+    async def fetch_page(page, token):
+        page_query, params = get_page_query(page, token)
+        rows = await fetch_rows(page_query, *params)
+        if isinstance(token, tuple) and token[0] == "previous":
+            rows = list(reversed(rows))
+
+        return rows
+
+    # The first pages are fetched in bulk, deeper pages only fetch their own rows
+    pages = {}
     query_start_time = time.time()
-    res = await db.execute_query(query)
+    if limit * page <= CACHE_ROWS:
+        res = await fetch_rows(
+            query + where + group + order_by + " limit " + str(CACHE_ROWS)
+        )
+        for i in range(0, len(res), limit):
+            pages[i // limit + 1] = res[i : i + limit]
+    else:
+        pages[page] = await fetch_page(page, None)
     query_end_time = time.time()
     query_execution_time = round(query_end_time - query_start_time, 2)
 
-    embed = discord.Embed(colour=discord.Colour(0xCC5288))
     total_missing_score = ""
+    if missingScore:
+        total_missing_query = (
+            "select sum(missing_score) from ("
+            + total_missing_query
+            + ") as total_missing_score"
+        )
+        score_res = await fetch_rows(total_missing_query)
+        score_sum = score_res[0][0]
+        if score_sum != None:
+            total_missing_score = " | Total missing score: " + "{:,}".format(score_sum)
+
+    def get_key(row):
+        return (row[keyset[1]], row[2], row[1])
+
+    async def get_page(page, token):
+        nonlocal query_execution_time
+        if page not in pages:
+            query_start_time = time.time()
+            pages[page] = await fetch_page(page, token)
+            query_execution_time = round(time.time() - query_start_time, 2)
+        page_rows = pages[page]
+
+        embed = discord.Embed(colour=discord.Colour(0xCC5288))
+        embed.description = format_beatmap_rows(
+            page_rows, order, bonusColumn, missingScore
+        )
+        embed.title = "Amount: " + str(count) + total_missing_score
+        embed.set_footer(
+            text="Page "
+            + str(page)
+            + " of "
+            + str(page_count)
+            + f" • took {query_execution_time}s",
+            icon_url="https://pek.li/maj7qa.png",
+        )
+
+        # Continuation tokens hold the key of the rows at the edges of this page
+        previous_token = None
+        next_token = None
+        if page > 1:
+            previous_token = page - 1
+            if keyset and page_rows:
+                previous_token = ("previous", get_key(page_rows[0]))
+        if page < page_count:
+            next_token = page + 1
+            if keyset and page_rows:
+                next_token = ("next", get_key(page_rows[-1]))
+
+        return embed, (previous_token, next_token)
+
+    def prefetch(page, tokens):
+        if tokens[1] is None or page + 1 in pages:
+            return
+        page_query, params = get_page_query(page + 1, tokens[1])
+        prefetch_result(db, (page_query, params), page_query, *params)
+
+    await reply_paginated(ctx, get_page, page, prefetch)
+
+
+def format_beatmap_rows(rows, order, bonusColumn=None, missingScore=False):
     s = ""
 
     if bonusColumn == None:
-        for b in res:
+        for b in rows:
             s = (
                 s
                 + str(round(b[5], 2))
@@ -952,9 +993,8 @@ async def get_beatmap_list(
                 + str(b[1])
                 + ")\n"
             )
-        embed.description = s
     elif missingScore:
-        for b in res:
+        for b in rows:
             s = (
                 s
                 + str(round(b[5], 2))
@@ -973,9 +1013,8 @@ async def get_beatmap_list(
                 + str(b[1])
                 + ")\n"
             )
-        embed.description = s
     else:
-        for b in res:
+        for b in rows:
             if order == "date_played" or order == "beatmaps.approved_date":
                 date = datetime.datetime.strptime(str(b[6]), "%Y-%m-%d %H:%M:%S")
                 timestamp = date.replace(tzinfo=datetime.timezone.utc).timestamp()
@@ -1011,33 +1050,12 @@ async def get_beatmap_list(
                 + str(b[1])
                 + ")\n"
             )
-        embed.description = s
-
-    if missingScore:
-        total_missing_query = (
-            "select sum(missing_score) from ("
-            + total_missing_query
-            + ") as total_missing_score"
-        )
-        res = await db.execute_query(total_missing_query)
-        score_sum = res[0][0]
-        if score_sum != None:
-            total_missing_score = " | Total missing score: " + "{:,}".format(score_sum)
 
-    embed.title = "Amount: " + str(count) + total_missing_score
-    embed.set_footer(
-        text="Page "
-        + str(page)
-        + " of "
-        + str(math.ceil(int(count) / int(limit)))
-        + f" • took {query_execution_time}s",
-        icon_url="https://pek.li/maj7qa.png",
-    )
-
-    await ctx.reply(embed=embed)
+    return s
 
 
 async def get_beatmap_ids(di, tables=None):
+    await resolve_user_filters(di)
     if not di.get("-mode"):
         di["-mode"] = "0"
     if not di.get("-loved"):
@@ -1087,6 +1105,7 @@ async def get_beatmap_ids(di, tables=None):
 
 
 async def get_completion(ctx, type, di):
+    await resolve_user_filters(di)
     user_id = await get_user_id(ctx, di)
     username = await get_username(user_id)
 
@@ -1417,6 +1436,7 @@ async def get_completion(ctx, type, di):
 
 
 async def get_pack_completion(ctx, di):
+    await resolve_user_filters(di)
     user_id = await get_user_id(ctx, di)
     username = await get_username(user_id)
     di["-mode"] = "0"
@@ -1545,6 +1565,95 @@ async def get_pack_completion(ctx, di):
     await ctx.reply(embed=embed)
 
 
+async def resolve_user_filters(di):
+    # an empty list is a filter on users that don't exist, it matches no one
+    keys = [key for key in user_filters if di.get(key) is not None]
+    if len(keys) == 0:
+        return
+
+    # Resolve every user of every filter in one query
+    users = []
+    for key in keys:
+        if not isinstance(di[key], list):
+            users += get_filter_users(di[key])
+    found = await lookup_user_ids(users)
+
+    for key in keys:
+        if isinstance(di[key], list):
+            continue
+        di[key] = [
+            found[user.lower()]
+            for user in get_filter_users(di[key])
+            if user.lower() in found
+        ]
+
+    if len(keys) < 2:
+        return
+
+    # Combined filters only need the beatmaps played by the listed users once
+    users = set()
+    having = []
+    params = []
+    for key in keys:
+        users.update(di[key])
+        params.append(di[key])
+        condition = f"user_id = ANY(${len(params) + 1}::int[])"
+        if key == "-ssed-by":
+            condition += " and rank like '%X%'"
+        if user_filters[key]:
+            having.append(f"bool_or({condition})")
+        else:
+            having.append(f"not bool_or({condition})")
+
+    query = f"""SELECT beatmap_id FROM scores WHERE user_id = ANY($1::int[])
+        GROUP BY beatmap_id HAVING {" AND ".join(having)}"""
+    print(query)
+    rows = await db.execute_query(query, list(users), *params)
+    if len(rows) > MAX_USER_FILTER_IDS:
+        return
+
+    beatmap_ids = {row[0] for row in rows}
+    if di.get(BEATMAP_IDS) is not None:
+        beatmap_ids &= set(di[BEATMAP_IDS])
+    di[BEATMAP_IDS] = sorted(beatmap_ids)
+    for key in keys:
+        del di[key]
+
+
+async def lookup_user_ids(users):
+    """Maps the usernames (lowercased) and ids among users that are in users2 to
+    their user_id"""
+    names = {str(user).lower() for user in users if not str(user).isnumeric()}
+    ids = {int(user) for user in users if str(user).isnumeric()}
+    if len(names) == 0 and len(ids) == 0:
+        return {}
+
+    rows = await db.execute_query(
+        "SELECT LOWER(username), user_id FROM users2 WHERE LOWER(username) = ANY($1::text[]) OR user_id = ANY($2::int[])",
+        list(names),
+        list(ids),
+    )
+    user_ids = {row[0]: row[1] for row in rows if row[0] in names}
+    known_ids = {row[1] for row in rows}
+    found = {}
+    for user in users:
+        key = str(user).lower()
+        if key.isnumeric():
+            if int(key) in known_ids:
+                found[key] = int(key)
+        elif key in user_ids:
+            found[key] = user_ids[key]
+
+    return found
+
+
+async def get_user_ids(users):
+    """User ids of usernames or ids in order, users not in users2 are left out"""
+    found = await lookup_user_ids(users)
+
+    return [found[str(user).lower()] for user in users if str(user).lower() in found]
+
+
 async def get_username(user_id):
     query = "SELECT username FROM users2 WHERE user_id = $1"
     res = await db.execute_query(query, user_id)
@@ -1579,21 +1688,26 @@ async def get_user_id(ctx, args):
         return user_id
 
 
-async def build_leaderboard(ctx, base, di, user=None):
+def get_page_args(di):
     limit = 10
     page = 1
-    direction = "desc"
 
-    if di.get("-direction") or di.get("-dir"):
-        if di.get("-dir"):
-            di["-direction"] = di["-dir"]
-        direction = di["-direction"]
     if di.get("-l"):
         limit = di["-l"]
     if di.get("-p"):
         page = di["-p"]
 
-    offset = int(limit) * (int(page) - 1)
+    return int(limit), int(page)
+
+
+async def build_leaderboard(ctx, base, di, user=None):
+    """The returned query takes the rank range to fetch as $1 < rank <= $2"""
+    direction = "desc"
+
+    if di.get("-direction") or di.get("-dir"):
+        if di.get("-dir"):
+            di["-direction"] = di["-dir"]
+        direction = di["-direction"]
 
     if di.get("-u") and not (di["-u"]).isnumeric():
         user = str(di["-u"]).replace("+", " ").lower()
@@ -1617,26 +1731,102 @@ async def build_leaderboard(ctx, base, di, user=None):
             WITH leaderboard AS (
                 {rank}
             )
-            SELECT rank, username, stat
+            SELECT rank, username, stat, LOWER(username) = '{user}' as is_user
             FROM leaderboard
             INNER JOIN users2 ON users2.user_id = leaderboard.user_id
-            WHERE rank <= {int(limit) * int(page)}
-                AND rank > {offset}
+            WHERE rank > $1 AND rank <= $2
                 OR LOWER(username) = '{user}'
             ORDER BY rank
-            LIMIT {int(limit) + 1}
         """
     else:
         leaderboard_query = f"""
             WITH leaderboard AS (
                 {rank}
             )
-            SELECT rank, username, stat
+            SELECT rank, username, stat, false as is_user
             FROM leaderboard
             INNER JOIN users2 ON users2.user_id = leaderboard.user_id
+            WHERE rank > $1 AND rank <= $2
             ORDER BY rank
-            LIMIT {limit}
-            OFFSET {offset}
         """
 
     return leaderboard_query
+
+
+async def get_leaderboard_rows(query, start, end):
+    rows = await get_prefetched_result((query, start, end))
+    if rows is None:
+        rows = await db.execute_query(query, start, end)
+        set_cached_result((query, start, end), rows)
+
+    return rows
+
+
+async def reply_leaderboard(ctx, query, di, title, datasource):
+    limit, page = get_page_args(di)
+    ranks = {}
+    user_rows = []
+    # rank of the last row, known once a fetch comes back short
+    total = None
+
+    async def load_ranks(start, end):
+        nonlocal total, user_rows
+        rows = await get_leaderboard_rows(query, start, end)
+        ranked_rows = [row for row in rows if start < row["rank"] <= end]
+        for row in ranked_rows:
+            ranks[row["rank"]] = row
+        user_rows = [row for row in rows if row["is_user"]]
+        if len(ranked_rows) < end - start:
+            total = start + len(ranked_rows)
+
+    # The first pages are fetched in bulk, deeper pages only fetch their own rank range
+    query_start_time = time.time()
+    if limit * page <= CACHE_ROWS:
+        await load_ranks(0, CACHE_ROWS)
+    else:
+        await load_ranks(limit * (page - 1), limit * page)
+    query_end_time = time.time()
+    query_execution_time = round(query_end_time - query_start_time, 2)
+
+    async def get_page(page, token):
+        nonlocal query_execution_time
+        offset = limit * (page - 1)
+        last = offset + limit if total is None else min(offset + limit, total)
+        if any(rank not in ranks for rank in range(offset + 1, last + 1)):
+            query_start_time = time.time()
+            await load_ranks(offset, offset + limit)
+            query_execution_time = round(time.time() - query_start_time, 2)
+            last = offset + limit if total is None else min(offset + limit, total)
+
+        page_rows = [ranks[rank] for rank in range(offset + 1, last + 1)]
+        page_rows += [row for row in user_rows if not offset < row["rank"] <= last]
+        page_rows.sort(key=lambda row: row["rank"])
+
+        embed = format_leaderboard(page_rows, di)
+        embed.title = title
+        if datasource == "ppv1":
+            footer_text = f"Updated every ~30min • took {query_execution_time}s"
+        else:
+            footer_text = format_footer(
+                datasource, query_execution_time, embed.description
+            )
+        embed.set_footer(
+            text=footer_text,
+            icon_url="https://pek.li/maj7qa.png",
+        )
+
+        previous_token = offset if page > 1 else None
+        next_token = offset + limit if total is None or total > last else None
+
+        return embed, (previous_token, next_token)
+
+    def prefetch(page, tokens):
+        start = tokens[1]
+        if start is None:
+            return
+        if all(rank in ranks for rank in range(start + 1, start + limit + 1)):
+            return
+        end = start + limit
+        prefetch_result(db, (query, start, end), query, start, end)
+
+    await reply_paginated(ctx, get_page, page, prefetch)
@@ -0,0 +1,121 @@
+-- Derived per-score metrics used by the lazerscore and agedscore leaderboards.
+-- Kept up to date by triggers on scores and beatmaps, run this file once to
+-- create the table and backfill it from the existing scores.
+
+CREATE TABLE IF NOT EXISTS score_metrics (
+    user_id bigint NOT NULL,
+    beatmap_id bigint NOT NULL,
+    standardised double precision,
+    standardised_nomod double precision,
+    lazerscore bigint,
+    lazerscore_nomod bigint,
+    -- older 300k accuracy / 700k combo formula used by -order lazerscore
+    lazerscore_old bigint,
+    -- score * days since epoch of the approved date, agedscore is
+    -- sum(score * current day - score_days) / 365.2425, null without a date
+    score_days bigint,
+    PRIMARY KEY (user_id, beatmap_id)
+);
+
+CREATE INDEX IF NOT EXISTS score_metrics_beatmap_id_idx ON score_metrics (beatmap_id);
+
+CREATE OR REPLACE FUNCTION score_metrics_select(p_user_id bigint, p_beatmap_id bigint)
+RETURNS TABLE (
+    user_id bigint,
+    beatmap_id bigint,
+    standardised double precision,
+    standardised_nomod double precision,
+    lazerscore bigint,
+    lazerscore_nomod bigint,
+    lazerscore_old bigint,
+    score_days bigint
+) AS $$
+    WITH base AS (
+        SELECT
+            scores.user_id,
+            scores.beatmap_id,
+            scores.score,
+            beatmaps.approved_date,
+            (beatmaps.circles + beatmaps.spinners + beatmaps.sliders) AS total_hit_objects,
+            mods.multiplier,
+            (50 * scores.count50 + 100 * scores.count100 + 300 * scores.count300)
+                / NULLIF(300 * scores.count50 + 300 * scores.count100 + 300 * scores.count300 + 300 * scores.countmiss, 0)::float AS accuracy,
+            scores.combo / NULLIF(beatmaps.maxcombo, 0)::float AS combo
+        FROM scores
+        INNER JOIN beatmaps ON scores.beatmap_id = beatmaps.beatmap_id
+        INNER JOIN mods ON scores.enabled_mods = mods.enum
+        WHERE (p_user_id IS NULL OR scores.user_id = p_user_id)
+            AND (p_beatmap_id IS NULL OR scores.beatmap_id = p_beatmap_id)
+    ), standardised AS (
+        SELECT
+            base.*,
+            (500000 * accuracy * combo) + (500000 * (accuracy ^ 5)) AS standardised_nomod,
+            ((accuracy * 300000) + (combo * 700000)) * multiplier AS standardised_old
+        FROM base
+    )
+    SELECT
+        user_id,
+        beatmap_id,
+        standardised_nomod * multiplier,
+        standardised_nomod,
+        (POW(((standardised_nomod * multiplier / 1000000) * total_hit_objects), 2) * 32.57 + 100000)::bigint,
+        (POW(((standardised_nomod / 1000000) * total_hit_objects), 2) * 32.57 + 100000)::bigint,
+        (POW(((standardised_old / 1000000) * total_hit_objects), 2) * 36)::bigint,
+        score * (approved_date::date - DATE '1970-01-01')
+    FROM standardised
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION score_metrics_refresh(p_user_id bigint, p_beatmap_id bigint)
+RETURNS void AS $$
+    INSERT INTO score_metrics
+    SELECT * FROM score_metrics_select(p_user_id, p_beatmap_id)
+    ON CONFLICT (user_id, beatmap_id) DO UPDATE SET
+        standardised = EXCLUDED.standardised,
+        standardised_nomod = EXCLUDED.standardised_nomod,
+        lazerscore = EXCLUDED.lazerscore,
+        lazerscore_nomod = EXCLUDED.lazerscore_nomod,
+        lazerscore_old = EXCLUDED.lazerscore_old,
+        score_days = EXCLUDED.score_days;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION score_metrics_scores_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM score_metrics
+        WHERE user_id = OLD.user_id AND beatmap_id = OLD.beatmap_id;
+        RETURN OLD;
+    END IF;
+
+    PERFORM score_metrics_refresh(NEW.user_id, NEW.beatmap_id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS score_metrics_scores ON scores;
+CREATE TRIGGER score_metrics_scores
+AFTER INSERT OR UPDATE OR DELETE ON scores
+FOR EACH ROW EXECUTE FUNCTION score_metrics_scores_trigger();
+
+-- Reranks and metadata updates change the combo and object counts of every score on the map
+CREATE OR REPLACE FUNCTION score_metrics_beatmaps_trigger() RETURNS trigger AS $$
+BEGIN
+    PERFORM score_metrics_refresh(NULL, NEW.beatmap_id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS score_metrics_beatmaps ON beatmaps;
+CREATE TRIGGER score_metrics_beatmaps
+AFTER UPDATE OF approved_date, maxcombo, circles, sliders, spinners ON beatmaps
+FOR EACH ROW
+WHEN (
+    OLD.approved_date IS DISTINCT FROM NEW.approved_date
+    OR OLD.maxcombo IS DISTINCT FROM NEW.maxcombo
+    OR OLD.circles IS DISTINCT FROM NEW.circles
+    OR OLD.sliders IS DISTINCT FROM NEW.sliders
+    OR OLD.spinners IS DISTINCT FROM NEW.spinners
+)
+EXECUTE FUNCTION score_metrics_beatmaps_trigger();
+
+-- Backfill
+SELECT score_metrics_refresh(NULL, NULL);
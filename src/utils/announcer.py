@@ -0,0 +1,107 @@
+import asyncio
+import json
+import os
+import traceback
+from discord.ext import tasks
+
+from sql.db import Database
+from utils.misc import updatelists
+from utils.outbox import flush_outbox
+
+db = Database()
+
+# Channel notified by the triggers in sql/announcements.sql, the payload is
+# {"feed": "newfcs", "beatmap_id": 1, "user_id": 2}
+ANNOUNCE_CHANNEL = "new_announcements"
+
+# Seconds between two sweeps of the new fc/ss tables, ANNOUNCE_INTERVAL in .env.
+# Entries are announced as they are notified, the sweep catches missed ones.
+ANNOUNCE_INTERVAL = 300
+
+# Held while announcing so two runs never post the same entries
+announce_lock = asyncio.Lock()
+
+# Connection listening on ANNOUNCE_CHANNEL
+listener = None
+# Announcements started by notifications, referenced until they finish
+announce_tasks = set()
+
+
+async def announce_entry(bot, payload):
+    try:
+        entry = json.loads(payload)
+        entry = (entry["feed"], int(entry["beatmap_id"]), int(entry["user_id"]))
+    except (ValueError, TypeError, KeyError):
+        print(f"Ignoring announcement notification: {payload}")
+        return
+
+    async with announce_lock:
+        try:
+            await updatelists(bot, entry)
+        except Exception:
+            traceback.print_exc()
+
+    await send_announcements(bot)
+
+
+async def send_announcements(bot):
+    try:
+        await flush_outbox(bot)
+    except Exception:
+        traceback.print_exc()
+
+
+async def listen(bot):
+    global listener
+    if listener is not None and not listener.is_closed():
+        return
+
+    def on_notification(connection, pid, channel, payload):
+        task = bot.loop.create_task(announce_entry(bot, payload))
+        announce_tasks.add(task)
+        task.add_done_callback(announce_tasks.discard)
+
+    try:
+        listener = await db.listen(ANNOUNCE_CHANNEL, on_notification)
+    except Exception as e:
+        # announcements fall back to the sweep until the next attempt
+        listener = None
+        print(f"Couldn't listen on {ANNOUNCE_CHANNEL}: {e}")
+
+
+async def notify_announcement(feed, beatmap_id, user_id):
+    """Fires the notification the feed triggers send, for testing"""
+    payload = json.dumps(
+        {"feed": feed, "beatmap_id": int(beatmap_id), "user_id": int(user_id)}
+    )
+    await db.execute_query("select pg_notify($1, $2)", ANNOUNCE_CHANNEL, payload)
+
+
+@tasks.loop(seconds=ANNOUNCE_INTERVAL)
+async def announce(bot):
+    # channels can't be fetched before the bot is connected
+    await bot.wait_until_ready()
+    # reconnects if the listening connection was lost
+    await listen(bot)
+    if announce_lock.locked():
+        return
+
+    async with announce_lock:
+        try:
+            await updatelists(bot)
+        except Exception:
+            # an unhandled error would stop the loop for good
+            traceback.print_exc()
+
+    # also retries announcements left in the outbox by failed sends
+    await send_announcements(bot)
+
+
+def start_announcer(bot):
+    if announce.is_running():
+        return
+
+    announce.change_interval(
+        seconds=float(os.getenv("ANNOUNCE_INTERVAL", ANNOUNCE_INTERVAL))
+    )
+    announce.start(bot)
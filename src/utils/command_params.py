@@ -10,7 +10,7 @@ BEATMAP_PARAMS = """```ahk
 -maxcombo-min/max: min/max combo of the beatmap
 -min/max: min/max star rating
 -range: range of star rating
--tags: specify tags
+-tags: specify tags. Join terms with + to match all of them, end a term with * for word prefixes
 -title: specify a title
 -mapper: specify a mapper name
 -artist: specify an artist name
@@ -141,6 +141,10 @@ your user_id. username won't work.
 -type: List to fetch. neverbeenssed, neverbeenfced, neverbeendted, scores, scoresimple, beatmaps, beatmapsimple, fc_count, top_score, top_score_nomod, top_score_hidden, registered, nomodnumberones, hiddennumberones, numberones
 -name: set a custom filename
 -u: specify a user
+```""",
+    "whatif": """```ahk
+-pp: pp of the new plays, comma separated (up to 10)
+-u: specify a user
 ```""",
     "card": """```ahk
 -u: specify a user
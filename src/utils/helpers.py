@@ -1,9 +1,12 @@
 import datetime
 import decimal
+import functools
+from collections import OrderedDict
 from textwrap import wrap
 import json
 import requests
 import dateutil.parser
+from utils.search import BEATMAP_IDS, resolve_search_filters
 
 
 def catbox_upload(file_name, file_path):
@@ -216,7 +219,106 @@ def get_args(arg=None):
     return di
 
 
+def get_filter_users(value):
+    users = str(value).replace("+", " ").replace("'", "")
+    return [user for user in users.split(",") if user != ""]
+
+
+def get_filter_users_sql(value):
+    """int[] of the users of -ssed-by, -cleared-by and -uncleared-by. The filters
+    hold a list of ids once resolve_user_filters has run, names are otherwise
+    resolved by the query itself."""
+    if isinstance(value, list):
+        return "'{" + ",".join(str(user_id) for user_id in value) + "}'::int[]"
+
+    users = get_filter_users(value)
+    if all(user.isnumeric() for user in users):
+        return "'{" + ",".join(users) + "}'::int[]"
+
+    names = ",".join(f"'{user.lower()}'" for user in users)
+    return f"ARRAY(select user_id from users2 where LOWER(username) = ANY(ARRAY[{names}]))"
+
+
+# Clauses built from argument sets seen before, keyed on the builder, its
+# extra arguments and the normalized arguments
+BUILDER_CACHE_SIZE = 1024
+builder_cache = OrderedDict()
+
+
+def normalize_arg(value):
+    if isinstance(value, (list, tuple, set)):
+        return tuple(normalize_arg(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, normalize_arg(v)) for k, v in value.items()))
+    return value
+
+
+def cached_builder(builder):
+    """Memoizes a clause builder taking the argument dict first. Builders also
+    rewrite some arguments (-y into -year, -month into -start/-end...), those
+    changes are recorded with the clause and replayed on cache hits."""
+
+    @functools.wraps(builder)
+    def wrapper(di, *args):
+        # today, yesterday and the default -month year depend on the date
+        now = datetime.datetime.utcnow()
+        try:
+            key = (
+                builder.__name__,
+                normalize_arg(args),
+                now.date(),
+                datetime.datetime.now().year,
+                # resolved id lists are applied outside the cached builders
+                normalize_arg({k: v for k, v in di.items() if k is not BEATMAP_IDS}),
+            )
+            hash(key)
+        except TypeError:
+            return builder(di, *args)
+
+        cached = builder_cache.get(key)
+        if cached is None:
+            before = dict(di)
+            result = builder(di, *args)
+            changed = {
+                k: v for k, v in di.items() if k not in before or before[k] is not v
+            }
+            removed = [k for k in before if k not in di]
+            cached = (result, changed, removed)
+
+            builder_cache[key] = cached
+            if len(builder_cache) > BUILDER_CACHE_SIZE:
+                builder_cache.popitem(last=False)
+        else:
+            builder_cache.move_to_end(key)
+
+        result, changed, removed = cached
+        di.update(changed)
+        for k in removed:
+            di.pop(k, None)
+
+        return result
+
+    return wrapper
+
+
 def build_where_clause(di, table=None):
+    # the search index changes over time, resolve its filters before the lookup
+    resolve_search_filters(di)
+    where = compile_where_clause(di, table)
+
+    # id lists can hold thousands of ids, they are left out of the cached clause
+    if di.get(BEATMAP_IDS) is not None:
+        beatmap_ids = ",".join(
+            str(int(beatmap_id)) for beatmap_id in di[BEATMAP_IDS]
+        )
+        condition = "beatmaps.beatmap_id = ANY('{" + beatmap_ids + "}'::int[])"
+        where += (" and " if where else " where ") + condition
+
+    return where
+
+
+@cached_builder
+def compile_where_clause(di, table=None):
     where = ""
     if di.get("-modded") and di["-modded"] == "true":
         if not (di.get("-notscorestable") and di["-notscorestable"] == "true"):
@@ -766,66 +868,24 @@ def build_where_clause(di, table=None):
                 + str(di["-user"])
                 + ")"
             )
-    if di.get("-ssed-by"):
-        users = str(di["-ssed-by"]).replace("+", " ")
-        users = users.replace("'", "")
-
-        if not users.replace(",", "").isnumeric():
-            users = users.split(",")
-            for i, user in enumerate(users):
-                users[i] = f"'{user}'"
-            users = ",".join(users)
-            where += (
-                " and beatmaps.beatmap_id in (select beatmap_id from scores inner join users2 on scores.user_id = users2.user_id where LOWER(users2.username) in ("
-                + users
-                + ") and rank like '%X%')"
-            )
-        else:
-            where += (
-                " and beatmaps.beatmap_id in (select beatmap_id from scores where user_id in ("
-                + users
-                + ") and rank like '%X%')"
-            )
-    if di.get("-cleared-by"):
-        users = str(di["-cleared-by"]).replace("+", " ")
-        users = users.replace("'", "")
-
-        if not users.replace(",", "").isnumeric():
-            users = users.split(",")
-            for i, user in enumerate(users):
-                users[i] = f"'{user}'"
-            users = ",".join(users)
-            where += (
-                " and beatmaps.beatmap_id in (select beatmap_id from scores inner join users2 on scores.user_id = users2.user_id where LOWER(users2.username) in ("
-                + users
-                + "))"
-            )
-        else:
-            where += (
-                " and beatmaps.beatmap_id in (select beatmap_id from scores where user_id in ("
-                + users
-                + "))"
-            )
-    if di.get("-uncleared-by"):
-        users = str(di["-uncleared-by"]).replace("+", " ")
-        users = users.replace("'", "")
-
-        if not users.replace(",", "").isnumeric():
-            users = users.split(",")
-            for i, user in enumerate(users):
-                users[i] = f"'{user}'"
-            users = ",".join(users)
-            where += (
-                " and beatmaps.beatmap_id not in (select beatmap_id from scores inner join users2 on scores.user_id = users2.user_id where LOWER(users2.username) in ("
-                + users
-                + "))"
-            )
-        else:
-            where += (
-                " and beatmaps.beatmap_id not in (select beatmap_id from scores where user_id in ("
-                + users
-                + "))"
-            )
+    if di.get("-ssed-by") is not None:
+        where += (
+            " and exists (select 1 from scores ssed where ssed.beatmap_id = beatmaps.beatmap_id and ssed.user_id = ANY("
+            + get_filter_users_sql(di["-ssed-by"])
+            + ") and ssed.rank like '%X%')"
+        )
+    if di.get("-cleared-by") is not None:
+        where += (
+            " and exists (select 1 from scores cleared where cleared.beatmap_id = beatmaps.beatmap_id and cleared.user_id = ANY("
+            + get_filter_users_sql(di["-cleared-by"])
+            + "))"
+        )
+    if di.get("-uncleared-by") is not None:
+        where += (
+            " and not exists (select 1 from scores uncleared where uncleared.beatmap_id = beatmaps.beatmap_id and uncleared.user_id = ANY("
+            + get_filter_users_sql(di["-uncleared-by"])
+            + "))"
+        )
     if di.get("-ar"):
         where += " and ar = " + str(di["-ar"])
     if di.get("-ar-max"):
@@ -1,11 +1,12 @@
 import datetime
 import gzip
+import json
 import os
 import struct
 import discord
 
 from utils.helpers import build_where_clause, catbox_upload, get_mods_string
-from sql.queries import get_user_id, get_username
+from sql.queries import get_user_id, get_username, resolve_user_filters
 from sql.db import Database
 
 db = Database()
@@ -38,6 +39,7 @@ def format_str(s):
 
 
 async def generateosdb(ctx, di):
+    await resolve_user_filters(di)
     if not di.get("-mode"):
         di["-mode"] = "0"
 
@@ -253,6 +255,7 @@ async def generateosdb(ctx, di):
 
 
 async def getfile(ctx, di):
+    await resolve_user_filters(di)
     user_id = await get_user_id(ctx, di)
     username = await get_username(user_id)
 
@@ -363,221 +366,135 @@ async def getfile(ctx, di):
             await ctx.reply("Your file is:", file=discord.File(file, filename))
 
 
-async def updatelists(client):
-    channel = client.get_channel(793570054008340511)
-    li = await db.execute_query("select * from newfcs")
-    if len(li) > 0:
-        print(len(li), "new fcs")
-        for entry in li:
-            beatmap, user, date = entry[0], entry[1], entry[2]
-            query = f"""select artist, title, diffname, beatmaps.approved_date, set_id, moddedsr.star_rating, length, maxcombo, 
-            modded_cs, modded_ar, modded_od, modded_hp, score, accuracy, enabled_mods, pp from scores
-            left join beatmaps on scores.beatmap_id = beatmaps.beatmap_id 
-            left join moddedsr on scores.beatmap_id = moddedsr.beatmap_id where scores.beatmap_id = {str(beatmap)} and user_id = {str(user)}
-            and moddedsr.mods_enum = (case when is_ht = 'true' then 256 else 0 end + case when is_dt = 'true' then 64 else 0 end + case when is_hr = 'true' then 16 else 0 end + case when is_ez = 'true' then 2 else 0 end + case when is_fl = 'true' then 1024 else 0 end + case when is_fl = 'true' and is_hd = 'true' then 8 else 0 end)"""
-            rows = await db.execute_query(query)
-            b = rows[0] if len(rows) > 0 else None
-            if b is None:
-                await db.execute_query(
-                    "delete from newfcs where beatmap_id = " + str(beatmap)
-                )
-                continue
-            approved_date = b[3]
-            minutes = b[6] // 60
-            seconds = b[6] % 60
-
-            # differential = ((date.year * 365) + (date.month*31) + (date.day)) - ((approved_date.year * 365) + (approved_date.month*31) + (approved_date.day))
-            differential = abs((date - approved_date).days)
-
-            if differential >= 7:
-                rows = await db.execute_query(
-                    "select username, pp, global_rank from users2 where user_id = "
-                    + str(user)
-                )
-                result = None
-                if len(rows) > 0:
-                    result = rows[0]
-                username = user
-                if result is not None:
-                    username = result[0]
-                    pp = result[1]
-                    rank = result[2]
-
-                embed = discord.Embed(
-                    title="A map has been FCed for the first time after "
-                    + str(differential)
-                    + " days!",
-                    colour=discord.Colour(0xE5E242),
-                )
-                author = {
-                    "name": f"""{username + " - " + str(pp) + "pp #" + str(rank) if result is not None else str(username)}""",
-                    "url": f"https://osu.ppy.sh/users/{user}",
-                    "icon_url": f"https://a.ppy.sh/{user}",
-                }
-                embed.set_author(
-                    name=author["name"], url=author["url"], icon_url=author["icon_url"]
-                )
-
-                score_pp = f"{b[15]:.2f}pp" if b[15] > 0 else "loved"
-                embed.description = f"""
-**[{b[0]} - {b[1]} [{b[2]}]](https://osu.ppy.sh/beatmapsets/{b[4]}#osu/{beatmap})**
-**{get_mods_string(b[14])} • {b[12]:,} • {b[13]}% • {score_pp}**
-**Time of play: ** <t:{date.replace(tzinfo=datetime.timezone.utc).timestamp():.0f}:R>
-**Date ranked: ** <t:{approved_date.replace(tzinfo=datetime.timezone.utc).timestamp():.0f}:f>
-
-**Beatmap information**
-CS **{b[8]:.1f}** • AR **{b[9]:.1f}** • OD **{b[10]:.1f}** • HP **{b[11]:.1f}** • **{b[5]:.2f}★**
-**{minutes}m{seconds}s** • **{b[7]} combo**
-                """
-
-                await channel.send(embed=embed)
-
-            await db.execute_query(
-                "delete from newfcs where beatmap_id = " + str(beatmap)
-            )
-
-    channel = client.get_channel(793594664262303814)
-
-    li = await db.execute_query("select * from newSSs")
-    if len(li) > 0:
-        print(len(li), "new sss")
-        for entry in li:
-            beatmap, user, date = entry[0], entry[1], entry[2]
-            query = f"""select artist, title, diffname, beatmaps.approved_date, set_id, moddedsr.star_rating, length, maxcombo, 
-            modded_cs, modded_ar, modded_od, modded_hp, score, accuracy, enabled_mods, pp from scores
-            left join beatmaps on scores.beatmap_id = beatmaps.beatmap_id 
-            left join moddedsr on scores.beatmap_id = moddedsr.beatmap_id where scores.beatmap_id = {str(beatmap)} and user_id = {str(user)}
-            and moddedsr.mods_enum = (case when is_ht = 'true' then 256 else 0 end + case when is_dt = 'true' then 64 else 0 end + case when is_hr = 'true' then 16 else 0 end + case when is_ez = 'true' then 2 else 0 end + case when is_fl = 'true' then 1024 else 0 end + case when is_fl = 'true' and is_hd = 'true' then 8 else 0 end)"""
-            rows = await db.execute_query(query)
-            b = rows[0] if len(rows) > 0 else None
-            if b is None:
-                await db.execute_query(
-                    "delete from newSSs where beatmap_id = " + str(beatmap)
-                )
-                continue
-            approved_date = b[3]
-            minutes = b[6] // 60
-            seconds = b[6] % 60
-
-            # differential = ((date.year * 365) + (date.month*31) + (date.day)) - ((approved_date.year * 365) + (approved_date.month*31) + (approved_date.day))
-            differential = abs((date - approved_date).days)
-
-            if differential >= 30:
-                rows = await db.execute_query(
-                    "select username, pp, global_rank from users2 where user_id = "
-                    + str(user)
-                )
-                result = None
-                if len(rows) > 0:
-                    result = rows[0]
-                username = user
-                if result is not None:
-                    username = result[0]
-                    pp = result[1]
-                    rank = result[2]
-
-                embed = discord.Embed(
-                    title="A map has been SSed for the first time after "
-                    + str(differential)
-                    + " days!",
-                    colour=discord.Colour(0xE5E242),
-                )
-                author = {
-                    "name": f"""{username + " - " + str(pp) + "pp #" + str(rank) if result is not None else str(username)}""",
-                    "url": f"https://osu.ppy.sh/users/{user}",
-                    "icon_url": f"https://a.ppy.sh/{user}",
-                }
-                embed.set_author(
-                    name=author["name"], url=author["url"], icon_url=author["icon_url"]
-                )
-
-                score_pp = f"{b[15]:.2f}pp" if b[15] > 0 else "loved"
-                embed.description = f"""
-**[{b[0]} - {b[1]} [{b[2]}]](https://osu.ppy.sh/beatmapsets/{b[4]}#osu/{beatmap})**
-**{get_mods_string(b[14])} • {b[12]:,} • {b[13]}% • {score_pp}**
-**Time of play: ** <t:{date.replace(tzinfo=datetime.timezone.utc).timestamp():.0f}:R>
-**Date ranked: ** <t:{approved_date.replace(tzinfo=datetime.timezone.utc).timestamp():.0f}:f>
-
-**Beatmap information**
-CS **{b[8]:.1f}** • AR **{b[9]:.1f}** • OD **{b[10]:.1f}** • HP **{b[11]:.1f}** • **{b[5]:.2f}★**
-**{minutes}m{seconds}s** • **{b[7]} combo**
-                """
-
-                await channel.send(embed=embed)
-
-            await db.execute_query(
-                "delete from newSSs where beatmap_id = " + str(beatmap)
-            )
-
-    channel = client.get_channel(942934179425943562)
-
-    li = await db.execute_query("select * from newdtfcs")
-    if len(li) > 0:
-        print(len(li), "new dt fcs")
-        for entry in li:
-            beatmap, user, date = entry[0], entry[1], entry[2]
-            query = f"""select artist, title, diffname, beatmaps.approved_date, set_id, moddedsr.star_rating, length, maxcombo, 
-            modded_cs, modded_ar, modded_od, modded_hp, score, accuracy, enabled_mods, pp from scores
-            left join beatmaps on scores.beatmap_id = beatmaps.beatmap_id 
-            left join moddedsr on scores.beatmap_id = moddedsr.beatmap_id where scores.beatmap_id = {str(beatmap)} and user_id = {str(user)}
-            and moddedsr.mods_enum = (case when is_ht = 'true' then 256 else 0 end + case when is_dt = 'true' then 64 else 0 end + case when is_hr = 'true' then 16 else 0 end + case when is_ez = 'true' then 2 else 0 end + case when is_fl = 'true' then 1024 else 0 end + case when is_fl = 'true' and is_hd = 'true' then 8 else 0 end)"""
-            rows = await db.execute_query(query)
-            b = rows[0] if len(rows) > 0 else None
-            if b is None:
-                await db.execute_query(
-                    "delete from newdtfcs where beatmap_id = " + str(beatmap)
-                )
-                continue
-            approved_date = b[3]
-            minutes = b[6] // 60
-            seconds = b[6] % 60
-
-            # differential = ((date.year * 365) + (date.month*31) + (date.day)) - ((approved_date.year * 365) + (approved_date.month*31) + (approved_date.day))
-            differential = abs((date - approved_date).days)
-
-            if differential >= 7:
-                rows = await db.execute_query(
-                    "select username, pp, global_rank from users2 where user_id = "
-                    + str(user)
-                )
-                result = None
-                if len(rows) > 0:
-                    result = rows[0]
-                username = user
-                if result is not None:
-                    username = result[0]
-                    pp = result[1]
-                    rank = result[2]
-
-                embed = discord.Embed(
-                    title="A map has been FCed with DT for the first time after "
-                    + str(differential)
-                    + " days!",
-                    colour=discord.Colour(0xE5E242),
-                )
-                author = {
-                    "name": f"""{username + " - " + str(pp) + "pp #" + str(rank) if result is not None else str(username)}""",
-                    "url": f"https://osu.ppy.sh/users/{user}",
-                    "icon_url": f"https://a.ppy.sh/{user}",
-                }
-                embed.set_author(
-                    name=author["name"], url=author["url"], icon_url=author["icon_url"]
-                )
-
-                score_pp = f"{b[15]:.2f}pp" if b[15] > 0 else "loved"
-                embed.description = f"""
-**[{b[0]} - {b[1]} [{b[2]}]](https://osu.ppy.sh/beatmapsets/{b[4]}#osu/{beatmap})**
-**{get_mods_string(b[14])} • {b[12]:,} • {b[13]}% • {score_pp}**
+# table of new entries, channel, minimum days since ranked, announcement title
+ANNOUNCEMENT_FEEDS = [
+    (
+        "newfcs",
+        793570054008340511,
+        7,
+        "A map has been FCed for the first time after {} days!",
+    ),
+    (
+        "newSSs",
+        793594664262303814,
+        30,
+        "A map has been SSed for the first time after {} days!",
+    ),
+    (
+        "newdtfcs",
+        942934179425943562,
+        7,
+        "A map has been FCed with DT for the first time after {} days!",
+    ),
+]
+
+
+def get_pending_announcements_query(feeds, where=""):
+    # the three feeds share the (beatmap_id, user_id, date) layout
+    pending = " union all ".join(
+        f"select '{table}', {table}.* from {table}{where}" for table, _, _, _ in feeds
+    )
+
+    return f"""select pending.feed, pending.beatmap_id, pending.user_id, pending.played_at,
+        artist, title, diffname, beatmaps.approved_date, set_id, moddedsr.star_rating, length, maxcombo,
+        modded_cs, modded_ar, modded_od, modded_hp, score, accuracy, enabled_mods, scores.pp,
+        scores.user_id is not null and moddedsr.beatmap_id is not null as found,
+        users2.user_id is not null as registered, users2.username, users2.pp as user_pp, users2.global_rank
+        from ({pending}) as pending(feed, beatmap_id, user_id, played_at)
+        left join scores on scores.beatmap_id = pending.beatmap_id and scores.user_id = pending.user_id
+        left join beatmaps on beatmaps.beatmap_id = pending.beatmap_id
+        left join moddedsr on moddedsr.beatmap_id = pending.beatmap_id
+        and moddedsr.mods_enum = (case when is_ht = 'true' then 256 else 0 end + case when is_dt = 'true' then 64 else 0 end + case when is_hr = 'true' then 16 else 0 end + case when is_ez = 'true' then 2 else 0 end + case when is_fl = 'true' then 1024 else 0 end + case when is_fl = 'true' and is_hd = 'true' then 8 else 0 end)
+        left join users2 on users2.user_id = pending.user_id
+        order by pending.played_at"""
+
+
+def build_announcement(row, title, differential):
+    beatmap, user, date = row["beatmap_id"], row["user_id"], row["played_at"]
+    approved_date = row["approved_date"]
+    minutes = row["length"] // 60
+    seconds = row["length"] % 60
+
+    embed = discord.Embed(
+        title=title.format(differential),
+        colour=discord.Colour(0xE5E242),
+    )
+    if row["registered"]:
+        name = f"{row['username']} - {row['user_pp']}pp #{row['global_rank']}"
+    else:
+        name = str(user)
+    embed.set_author(
+        name=name,
+        url=f"https://osu.ppy.sh/users/{user}",
+        icon_url=f"https://a.ppy.sh/{user}",
+    )
+
+    score_pp = f"{row['pp']:.2f}pp" if row["pp"] > 0 else "loved"
+    embed.description = f"""
+**[{row['artist']} - {row['title']} [{row['diffname']}]](https://osu.ppy.sh/beatmapsets/{row['set_id']}#osu/{beatmap})**
+**{get_mods_string(row['enabled_mods'])} • {row['score']:,} • {row['accuracy']}% • {score_pp}**
 **Time of play: ** <t:{date.replace(tzinfo=datetime.timezone.utc).timestamp():.0f}:R>
 **Date ranked: ** <t:{approved_date.replace(tzinfo=datetime.timezone.utc).timestamp():.0f}:f>
 
 **Beatmap information**
-CS **{b[8]:.1f}** • AR **{b[9]:.1f}** • OD **{b[10]:.1f}** • HP **{b[11]:.1f}** • **{b[5]:.2f}★**
-**{minutes}m{seconds}s** • **{b[7]} combo**
+CS **{row['modded_cs']:.1f}** • AR **{row['modded_ar']:.1f}** • OD **{row['modded_od']:.1f}** • HP **{row['modded_hp']:.1f}** • **{row['star_rating']:.2f}★**
+**{minutes}m{seconds}s** • **{row['maxcombo']} combo**
                 """
 
-                await channel.send(embed=embed)
+    return embed
+
+
+async def queue_announcements(table, channel_id, handled, embeds):
+    """Moves the handled entries of a feed to the announcement outbox in one
+    statement, so an entry is either still pending or queued for sending"""
+    await db.execute_query(
+        f"""with handled as (
+            delete from {table} using unnest($1::bigint[], $2::bigint[]) as entries(beatmap_id, user_id)
+            where {table}.beatmap_id = entries.beatmap_id and {table}.user_id = entries.user_id
+        )
+        insert into announcement_outbox (channel_id, embed)
+        select $3::bigint, queued.embed::jsonb from unnest($4::text[]) with ordinality as queued(embed, position)
+        order by queued.position""",
+        [beatmap for beatmap, _ in handled],
+        [user for _, user in handled],
+        channel_id,
+        [json.dumps(embed.to_dict()) for embed in embeds],
+    )
+
+
+async def updatelists(client, entry=None):
+    """Queues the pending entries of every feed, or only entry, a
+    (table, beatmap_id, user_id) tuple, when one is given. The announcements are
+    sent by flush_outbox."""
+    feeds = ANNOUNCEMENT_FEEDS
+    where = ""
+    params = []
+    if entry is not None:
+        table, beatmap_id, user_id = entry
+        feeds = [feed for feed in feeds if feed[0].lower() == table.lower()]
+        where = " where beatmap_id = $1 and user_id = $2"
+        params = [int(beatmap_id), int(user_id)]
+    if len(feeds) == 0:
+        return
 
-            await db.execute_query(
-                "delete from newdtfcs where beatmap_id = " + str(beatmap)
-            )
+    rows = await db.execute_query(
+        get_pending_announcements_query(feeds, where), *params
+    )
+
+    for table, channel_id, min_days, title in feeds:
+        entries = [row for row in rows if row["feed"] == table]
+        if len(entries) == 0:
+            continue
+        print(len(entries), "new entries in", table)
+
+        handled = []
+        embeds = []
+        for row in entries:
+            # entries without a matching score are dropped, old maps are announced
+            if row["found"]:
+                days = abs((row["played_at"] - row["approved_date"]).days)
+                if days >= min_days:
+                    embeds.append(build_announcement(row, title, days))
+            handled.append((row["beatmap_id"], row["user_id"]))
+
+        await queue_announcements(table, channel_id, handled, embeds)
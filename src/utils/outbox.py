@@ -0,0 +1,142 @@
+import asyncio
+import json
+import time
+from collections import deque
+import discord
+
+from sql.db import Database
+
+db = Database()
+
+# Discord limits of a single message
+MAX_EMBEDS = 10
+MAX_EMBED_CHARACTERS = 6000
+
+# Messages sent per channel within OUTBOX_PERIOD seconds, the channel bucket of
+# Discord allows 5 every 5 seconds
+OUTBOX_RATE = 5
+OUTBOX_PERIOD = 5
+
+# Recent messages checked for announcements sent before a restart
+OUTBOX_HISTORY = 25
+
+# channel_id -> times of the last messages sent
+sent_times = {}
+outbox_lock = asyncio.Lock()
+
+
+async def wait_for_bucket(channel_id):
+    times = sent_times.setdefault(channel_id, deque(maxlen=OUTBOX_RATE))
+    if len(times) == OUTBOX_RATE:
+        delay = times[0] + OUTBOX_PERIOD - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    times.append(time.monotonic())
+
+
+def get_batches(rows):
+    """Groups consecutive rows into messages of up to 10 embeds and 6000 characters"""
+    batches = []
+    batch = []
+    characters = 0
+    for row in rows:
+        size = len(row["embed"])
+        if batch and (
+            len(batch) == MAX_EMBEDS or characters + size > MAX_EMBED_CHARACTERS
+        ):
+            batches.append(batch)
+            batch = []
+            characters = 0
+        batch.append(row)
+        characters += size
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+async def get_sent_descriptions(client, channel):
+    """Descriptions of the embeds recently posted by the bot in the channel"""
+    descriptions = set()
+    async for message in channel.history(limit=OUTBOX_HISTORY):
+        if message.author == client.user:
+            descriptions.update(
+                (embed.description or "").strip() for embed in message.embeds
+            )
+
+    return descriptions
+
+
+async def delete_rows(rows):
+    await db.execute_query(
+        "delete from announcement_outbox where id = ANY($1::bigint[])",
+        [row["id"] for row in rows],
+    )
+
+
+async def flush_channel(client, channel_id, rows):
+    channel = client.get_channel(channel_id)
+    if channel is None:
+        print(f"Outbox channel {channel_id} not found")
+        return
+
+    # a crash between sending and deleting leaves attempted rows behind,
+    # skip the ones that made it to the channel
+    if any(row["attempted"] for row in rows):
+        sent = await get_sent_descriptions(client, channel)
+        duplicates = [
+            row
+            for row in rows
+            if row["attempted"] and (row["embed"].description or "").strip() in sent
+        ]
+        if duplicates:
+            await delete_rows(duplicates)
+            duplicate_ids = {row["id"] for row in duplicates}
+            rows = [row for row in rows if row["id"] not in duplicate_ids]
+
+    for batch in get_batches(rows):
+        await wait_for_bucket(channel_id)
+        await db.execute_query(
+            "update announcement_outbox set attempted = true where id = ANY($1::bigint[])",
+            [row["id"] for row in batch],
+        )
+        try:
+            await channel.send(embeds=[row["embed"] for row in batch])
+        except discord.HTTPException as e:
+            print(f"Couldn't send announcements to {channel_id}: {e}")
+            if e.status == 400:
+                # the embeds themselves are invalid, retrying won't help
+                await delete_rows(batch)
+                continue
+            # keep the rest queued for the next flush
+            return
+        await delete_rows(batch)
+
+
+async def flush_outbox(client):
+    """Sends the queued announcements, oldest first"""
+    async with outbox_lock:
+        rows = await db.execute_query(
+            "select id, channel_id, embed::text, attempted from announcement_outbox order by id"
+        )
+        if len(rows) == 0:
+            return
+        print(len(rows), "announcements to send")
+
+        channels = {}
+        for row in rows:
+            channels.setdefault(row["channel_id"], []).append(
+                {
+                    "id": row["id"],
+                    "attempted": row["attempted"],
+                    "embed": discord.Embed.from_dict(json.loads(row["embed"])),
+                }
+            )
+
+        # channels have separate rate limit buckets
+        await asyncio.gather(
+            *(
+                flush_channel(client, channel_id, channel_rows)
+                for channel_id, channel_rows in channels.items()
+            )
+        )
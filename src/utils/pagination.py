@@ -0,0 +1,145 @@
+import asyncio
+import time
+import discord
+
+# Rows kept from the first execution of a query, later pages are sliced from these
+CACHE_ROWS = 1000
+CACHE_TTL = 300
+CACHE_SIZE = 100
+
+# query -> (created_at, result)
+result_cache = {}
+# query -> task fetching it in the background
+prefetch_tasks = {}
+
+
+def get_cached_result(key):
+    cached = result_cache.get(key)
+    if cached is None:
+        return None
+    if time.time() - cached[0] > CACHE_TTL:
+        del result_cache[key]
+        return None
+
+    return cached[1]
+
+
+def set_cached_result(key, result):
+    now = time.time()
+    for cached_key, cached in list(result_cache.items()):
+        if now - cached[0] > CACHE_TTL:
+            del result_cache[cached_key]
+
+    # drop the oldest results once the cache is full
+    while len(result_cache) >= CACHE_SIZE:
+        del result_cache[min(result_cache, key=lambda k: result_cache[k][0])]
+
+    result_cache[key] = (now, result)
+
+
+def prefetch_result(db, key, query, *params):
+    """Runs the query in the background and caches its result under key, if the
+    pool has a connection to spare. The database cancels it under pressure."""
+    if key in prefetch_tasks or get_cached_result(key) is not None:
+        return
+    if not db.has_spare_connection():
+        return
+
+    async def prefetch():
+        try:
+            set_cached_result(key, await db.execute_background(query, *params))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Prefetch failed: {e}")
+        finally:
+            del prefetch_tasks[key]
+
+    prefetch_tasks[key] = asyncio.create_task(prefetch())
+
+
+async def get_prefetched_result(key):
+    """Cached result of the query, waiting for its prefetch if one is running"""
+    task = prefetch_tasks.get(key)
+    if task is not None:
+        await asyncio.wait([task])
+
+    return get_cached_result(key)
+
+
+class PaginationView(discord.ui.View):
+    """get_page(page, token) returns the embed for that page along with the
+    continuation tokens of its previous and next pages, a None token disables
+    the button. prefetch(page, tokens) is called once a page has been sent."""
+
+    def __init__(self, user, get_page, page, tokens, prefetch=None):
+        super().__init__(timeout=CACHE_TTL)
+
+        self.user = user
+        self.get_page = get_page
+        self.prefetch = prefetch
+        self.page = page
+        self.message = None
+
+        self.previous_button = discord.ui.Button(
+            label="◀", style=discord.ButtonStyle.secondary
+        )
+        self.next_button = discord.ui.Button(
+            label="▶", style=discord.ButtonStyle.secondary
+        )
+        self.previous_button.callback = self.on_previous
+        self.next_button.callback = self.on_next
+
+        self.add_item(self.previous_button)
+        self.add_item(self.next_button)
+        self.update_buttons(tokens)
+
+    def update_buttons(self, tokens):
+        self.previous_button.token, self.next_button.token = tokens
+        self.previous_button.disabled = self.previous_button.token is None
+        self.next_button.disabled = self.next_button.token is None
+
+    async def on_previous(self, interaction: discord.Interaction):
+        await self.change_page(interaction, self.page - 1, self.previous_button.token)
+
+    async def on_next(self, interaction: discord.Interaction):
+        await self.change_page(interaction, self.page + 1, self.next_button.token)
+
+    async def change_page(self, interaction, page, token):
+        # Check if the user who issued the command is the one who pressed the button
+        if interaction.user.id != self.user.id:
+            return await interaction.response.send_message(
+                "You can't use these buttons.", ephemeral=True
+            )
+
+        # Pages past the cached rows need a query, don't let the interaction expire
+        await interaction.response.defer()
+        embed, tokens = await self.get_page(page, token)
+        self.page = page
+        self.update_buttons(tokens)
+
+        await interaction.edit_original_response(embed=embed, view=self)
+        if self.prefetch is not None:
+            self.prefetch(page, tokens)
+
+    async def on_timeout(self):
+        # The cached result is gone by now, remove the buttons
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+
+async def reply_paginated(ctx, get_page, page, prefetch=None):
+    embed, tokens = await get_page(page, None)
+    if tokens == (None, None):
+        return await ctx.reply(embed=embed)
+
+    view = PaginationView(ctx.author, get_page, page, tokens, prefetch)
+    view.message = await ctx.reply(embed=embed, view=view)
+    # a follow up -p or button press for the next page is likely
+    if prefetch is not None:
+        prefetch(page, tokens)
+
+    return view.message
@@ -0,0 +1,240 @@
+import asyncio
+import re
+import time
+from bisect import bisect_left
+
+from sql.db import Database
+
+db = Database()
+
+REFRESH_INTERVAL = 1800
+# Above this many matches the id list costs more than the LIKE scan it replaces
+MAX_IDS = 20000
+
+FIELDS = ("source", "tags", "artist", "title", "creator", "diffname")
+# filter -> field it matches against, None matches a substring of any field
+SEARCH_FILTERS = {
+    "-tags": None,
+    "-artist": "artist",
+    "-title": "title",
+    "-mapper": "creator",
+    "-diff": "diffname",
+}
+
+# Key of the beatmap ids the text and user filters resolve to. It isn't a string,
+# so no argument typed by a user can set it.
+BEATMAP_IDS = object()
+
+search_index = None
+loading = False
+
+
+def get_trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def intersect_postings(postings, lists):
+    """Intersects the posting lists of every trigram, None if any is missing"""
+    result = None
+    for key in sorted(lists, key=lambda key: len(postings.get(key, ()))):
+        if key not in postings:
+            return set()
+        if result is None:
+            result = set(postings[key])
+        else:
+            result.intersection_update(postings[key])
+        if not result:
+            break
+
+    return result
+
+
+def like_to_regex(pattern):
+    regex = ""
+    escaped = False
+    for char in pattern:
+        if escaped:
+            regex += re.escape(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == "%":
+            regex += ".*"
+        elif char == "_":
+            regex += "."
+        else:
+            regex += re.escape(char)
+
+    return re.compile(regex, re.DOTALL)
+
+
+def like_literals(pattern):
+    return [part for part in re.split(r"[%_\\]", pattern) if len(part) >= 3]
+
+
+class SearchIndex:
+    def __init__(self, rows):
+        self.loaded_at = time.time()
+
+        # distinct lowercased values of each field with the beatmaps using them
+        ids_by_value = {field: {} for field in FIELDS}
+        # whitespace separated tokens of every field, for -tags
+        token_ids = {}
+
+        for row in rows:
+            for i, field in enumerate(FIELDS):
+                value = row[i + 1]
+                if value is None:
+                    continue
+                ids_by_value[field].setdefault(value, []).append(row[0])
+                for token in value.split():
+                    ids = token_ids.setdefault(token, [])
+                    if not ids or ids[-1] != row[0]:
+                        ids.append(row[0])
+
+        self.values = {}
+        self.value_ids = {}
+        self.value_trigrams = {}
+        for field in FIELDS:
+            self.values[field] = list(ids_by_value[field])
+            self.value_ids[field] = list(ids_by_value[field].values())
+
+            # tags are only searched through the token index
+            if field != "tags":
+                trigrams = {}
+                for index, value in enumerate(self.values[field]):
+                    for trigram in get_trigrams(value):
+                        trigrams.setdefault(trigram, []).append(index)
+                self.value_trigrams[field] = trigrams
+
+        self.tokens = sorted(token_ids)
+        self.token_ids = [token_ids[token] for token in self.tokens]
+        self.token_trigrams = {}
+        for index, token in enumerate(self.tokens):
+            for trigram in get_trigrams(token):
+                self.token_trigrams.setdefault(trigram, []).append(index)
+
+    def search_tokens(self, term):
+        """Beatmaps with a token starting with term (term*) or containing it"""
+        if term.endswith("*"):
+            prefix = term[:-1]
+            start = bisect_left(self.tokens, prefix)
+            end = start
+            while end < len(self.tokens) and self.tokens[end].startswith(prefix):
+                end += 1
+            indexes = range(start, end)
+        else:
+            candidates = intersect_postings(self.token_trigrams, get_trigrams(term))
+            if candidates is None:
+                candidates = range(len(self.tokens))
+            indexes = [index for index in candidates if term in self.tokens[index]]
+
+        ids = set()
+        for index in indexes:
+            ids.update(self.token_ids[index])
+
+        return ids
+
+    def search_field(self, field, term):
+        """Beatmaps whose field matches the LIKE pattern, or has a word starting with term*"""
+        if term.endswith("*"):
+            regex = re.compile(r"(^|\s)" + re.escape(term[:-1]))
+            literals = [term[:-1]] if len(term) > 3 else []
+            match = regex.search
+        else:
+            regex = like_to_regex(term)
+            literals = like_literals(term)
+            match = regex.fullmatch
+
+        trigrams = set()
+        for literal in literals:
+            trigrams |= get_trigrams(literal)
+        candidates = intersect_postings(self.value_trigrams[field], trigrams)
+        if candidates is None:
+            candidates = range(len(self.values[field]))
+
+        values = self.values[field]
+        ids = set()
+        for index in candidates:
+            if match(values[index]):
+                ids.update(self.value_ids[field][index])
+
+        return ids
+
+    def search(self, field, value):
+        """Terms of -tags separated by + must all match, other fields match the
+        whole value like their LIKE filter. None when the LIKE filter should be kept"""
+        value = str(value).lower()
+        terms = value.split("+") if field is None else [value]
+        ids = None
+        for term in terms:
+            if term == "" or term == "*":
+                continue
+            if field is None:
+                # tokens can't hold wildcards, leave those to the database
+                if "%" in term or "_" in term or "\\" in term:
+                    return None
+                term_ids = self.search_tokens(term)
+            else:
+                term_ids = self.search_field(field, term)
+
+            ids = term_ids if ids is None else ids & term_ids
+
+        return ids
+
+
+async def refresh_search_index():
+    global search_index, loading
+    loading = True
+    try:
+        rows = await db.execute_query(
+            "select beatmap_id, "
+            + ", ".join(f"lower(beatmaps.{field})" for field in FIELDS)
+            + " from beatmaps"
+        )
+        # building the index takes a few seconds, keep the bot responsive meanwhile
+        loop = asyncio.get_running_loop()
+        search_index = await loop.run_in_executor(None, SearchIndex, rows)
+        print(f"Search index loaded with {len(rows)} beatmaps")
+    finally:
+        loading = False
+
+
+def resolve_search_filters(di):
+    """Replaces the text filters with the BEATMAP_IDS they resolve to. Until the
+    index is loaded the filters are left as they are and run as LIKE scans."""
+    if not any(di.get(key) for key in SEARCH_FILTERS):
+        return
+
+    global loading
+    if not loading and (
+        search_index is None
+        or time.time() - search_index.loaded_at > REFRESH_INTERVAL
+    ):
+        try:
+            asyncio.get_running_loop().create_task(refresh_search_index())
+            loading = True
+        except RuntimeError:
+            pass
+    if search_index is None:
+        return
+
+    ids = None
+    resolved = []
+    for key, field in SEARCH_FILTERS.items():
+        if not di.get(key):
+            continue
+        key_ids = search_index.search(field, di[key])
+        if key_ids is None:
+            continue
+        ids = key_ids if ids is None else ids & key_ids
+        resolved.append(key)
+
+    if ids is None or len(ids) > MAX_IDS:
+        return
+
+    if di.get(BEATMAP_IDS) is not None:
+        ids &= set(di[BEATMAP_IDS])
+    for key in resolved:
+        del di[key]
+    di[BEATMAP_IDS] = sorted(ids)
@@ -0,0 +1,175 @@
+import time
+from bisect import bisect_right
+import discord
+
+from sql.db import Database
+from sql.queries import get_user_id
+from utils.helpers import build_where_clause
+
+db = Database()
+
+WEIGHT = 0.95
+MAX_PLAYS = 10
+CACHE_TTL = 300
+
+# user_id -> (loaded_at, pp list sorted ascending, prefix sums, bonus by count, db total)
+top_plays_cache = {}
+# (loaded_at, profile pp of every user sorted ascending, user_id -> (username, pp))
+profile_pp_cache = None
+
+
+async def load_top_plays(user_id):
+    cached = top_plays_cache.get(user_id)
+    if cached and time.time() - cached[0] < CACHE_TTL:
+        return cached
+
+    # Same scores and filters as the default `!query -o pp` leaderboard
+    where = build_where_clause({"-loved": "false", "-user": user_id}, "scores")
+    rows = await db.execute_query(
+        f"""select coalesce(array_agg(scores.pp::float order by scores.pp desc), '{{}}') as pps
+        from scores inner join beatmaps on scores.beatmap_id = beatmaps.beatmap_id{where}"""
+    )
+    pps = [pp for pp in rows[0]["pps"] if pp is not None]
+
+    # bonus_pp only depends on the play count, fetch it for every count we can reach
+    # so the projection stays consistent with the sql function
+    bonus_rows = await db.execute_query(
+        "select n, bonus_pp(n) as bonus from generate_series($1::bigint, $2::bigint) n",
+        len(pps),
+        len(pps) + MAX_PLAYS,
+    )
+    bonus = {row["n"]: float(row["bonus"]) for row in bonus_rows}
+
+    # prefix[i] holds the weighted sum of the i best plays
+    prefix = [0.0]
+    for i, pp in enumerate(pps):
+        prefix.append(prefix[-1] + pp * WEIGHT**i)
+
+    pps.reverse()
+    now = time.time()
+    # expired entries hold a full top play list each, drop them
+    for cached_user_id, entry in list(top_plays_cache.items()):
+        if now - entry[0] >= CACHE_TTL:
+            del top_plays_cache[cached_user_id]
+    cached = (now, pps, prefix, bonus, prefix[-1] + bonus[len(pps)])
+    top_plays_cache[user_id] = cached
+
+    return cached
+
+
+async def load_profile_pp():
+    global profile_pp_cache
+    if profile_pp_cache and time.time() - profile_pp_cache[0] < CACHE_TTL:
+        return profile_pp_cache
+
+    rows = await db.execute_query(
+        "select user_id, username, pp::float from users2 where pp is not null order by pp"
+    )
+    profile_pp_cache = (
+        time.time(),
+        [row["pp"] for row in rows],
+        {row["user_id"]: (row["username"], row["pp"]) for row in rows},
+    )
+
+    return profile_pp_cache
+
+
+def project_weighted_pp(pps, prefix, plays):
+    """pps is sorted ascending and prefix holds the weighted sums of the
+    descending order. Each new play shifts every play below it down one spot,
+    so the existing plays are summed in runs between insertion points."""
+    n = len(pps)
+    total = 0.0
+    previous = 0
+    for shift, pp in enumerate(sorted(plays, reverse=True)):
+        # number of existing plays strictly better than this one
+        index = n - bisect_right(pps, pp)
+        total += (prefix[index] - prefix[previous]) * WEIGHT**shift
+        total += pp * WEIGHT ** (index + shift)
+        previous = index
+
+    total += (prefix[n] - prefix[previous]) * WEIGHT ** len(plays)
+
+    return total
+
+
+async def get_whatif(user_id, plays):
+    _, pps, prefix, bonus, current = await load_top_plays(user_id)
+    _, leaderboard, users = await load_profile_pp()
+    username, profile_pp = users.get(user_id, (str(user_id), None))
+    count = len(pps) + len(plays)
+
+    weighted = project_weighted_pp(pps, prefix, plays)
+    projected = weighted + bonus[count]
+    difference = projected - current
+
+    new_profile_pp = (profile_pp or 0) + difference
+    # users strictly above the projected pp, not counting the user's current entry
+    rank = len(leaderboard) - bisect_right(leaderboard, new_profile_pp) + 1
+    if profile_pp is not None and profile_pp > new_profile_pp:
+        rank -= 1
+
+    current_rank = None
+    if profile_pp is not None:
+        current_rank = len(leaderboard) - bisect_right(leaderboard, profile_pp) + 1
+
+    return {
+        "username": username,
+        "current": current,
+        "weighted": weighted,
+        "bonus": bonus[count],
+        "projected": projected,
+        "difference": difference,
+        "profile_pp": profile_pp,
+        "new_profile_pp": new_profile_pp,
+        "rank": rank,
+        "current_rank": current_rank,
+    }
+
+
+async def whatif_pp(ctx, di):
+    if not di.get("-pp"):
+        raise ValueError("Please specify one or more pp values with -pp, e.g. -pp 500,450")
+
+    try:
+        plays = [float(pp) for pp in str(di["-pp"]).split(",") if pp != ""]
+    except ValueError:
+        raise ValueError("-pp must be a comma separated list of numbers")
+    if len(plays) == 0 or len(plays) > MAX_PLAYS:
+        raise ValueError(f"Please specify between 1 and {MAX_PLAYS} pp values")
+    if any(pp < 0 for pp in plays):
+        raise ValueError("pp values can't be negative")
+
+    user_id = await get_user_id(ctx, di)
+    if not user_id:
+        raise ValueError("User not in the database.")
+    user_id = int(user_id)
+
+    start_time = time.time()
+    result = await get_whatif(user_id, plays)
+    execution_time = round(time.time() - start_time, 2)
+
+    plays_string = ", ".join(f"{pp:,.2f}" for pp in plays)
+    description = "```pascal\n"
+    description += f"New plays     | {plays_string}\n"
+    description += f"Weighted pp   | {result['current']:,.2f} -> {result['projected']:,.2f}\n"
+    description += f"Bonus pp      | {result['bonus']:,.2f}\n"
+    description += f"Difference    | +{result['difference']:,.2f}\n"
+    if result["profile_pp"] is not None:
+        description += f"Profile pp    | {result['profile_pp']:,.2f} -> {result['new_profile_pp']:,.2f}\n"
+        description += f"Rank          | #{result['current_rank']:,} -> #{result['rank']:,}\n"
+    else:
+        description += f"Rank          | #{result['rank']:,}\n"
+    description += "```"
+
+    embed = discord.Embed(
+        title=f"What if {result['username']} set {plays_string}pp",
+        colour=discord.Colour(0xCC5288),
+        description=description,
+    )
+    embed.set_footer(
+        text=f"Based on Scores in the database • took {execution_time}s",
+        icon_url="https://pek.li/maj7qa.png",
+    )
+
+    await ctx.reply(embed=embed)